@@ -12,6 +12,8 @@ import web
 import config
 import app.controllers
 
+from app.utils import compress
+
 #from app.helpers import error
 
 urls = (        
@@ -30,17 +32,28 @@ urls = (
 
     '/breaks/([0-9]*)',                  'app.controllers.cuereview.Break',
     '/frames/([0-9]*)',                  'app.controllers.cuereview.FrameSummary',
+    '/frames/([0-9]*)/breaks',           'app.controllers.cuereview.FrameBreaks',
+
+    '/api/matches',                     'app.controllers.api.Matches',
+    '/api/matches/([0-9]+)',            'app.controllers.api.Match',
+    '/api/frames/([0-9]+)',             'app.controllers.api.Frame',
+    '/api/players',                     'app.controllers.api.Players',
+    '/api/players/([a-z]+)',            'app.controllers.api.Player',
+    '/api/stats',                       'app.controllers.api.PlayerStats',
+
+    '/status/cache',                    'app.controllers.cuereview.CacheStatus',
+    '/status/templates',                'app.controllers.cuereview.TemplateStatus',
     
 #    '/settings/teams',                  'app.controllers.settings.settings_teams',
  #   '/settings/teams/([A-Z]*)',         'app.controllers.settings.settings_team',
 )
 
 app = web.application(urls, globals())
-#application = web.application(urls, globals()).wsgifunc()
+application = compress.middleware(app.wsgifunc())
 
 # Handle errors and 404's
 #if not web.config.debug:
 #    error.add(app)
 
 if __name__ == "__main__":
-    app.run()
+    app.run(compress.middleware)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+api.py: Read-only JSON API for matches, frames (with breaks and pots), players and stats.
+
+Breaks and pots are sent in columns rather than one object per row, e.g. a frame's breaks are
+    {"break_id": [135, 136], "player_id": [2, 1], "score": [33, 38], ..., "pots": [8, 7]}
+    {"ball_id": [8, 6, 5, ...], "points": [6, 1, 2, ...]}
+where "pots" is how many of the pots belong to each break, in order. Ball names are in /api/stats.
+
+Every response has an ETag, send it back in If-None-Match to get a 304 when nothing has changed.
+Lists of matches are paged like the HTML pages: pass the "earlier" / "later" cursor back as before / after.
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+
+import web
+import config
+import json
+
+from app.utils import tools
+from app.utils import cache
+
+from app.models import tmatch
+from app.models import tframe
+from app.models import tplayer
+from app.models import breakpot
+
+from app.controllers.cuereview import Stats, getStatsWindow
+
+CONTENT_TYPE = 'application/json; charset=utf-8'
+
+BREAK_COLUMNS = ['break_id', 'break_num', 'player_id', 'score', 'length', 'foul_num', 'frame_score', 'opp_frame_score']
+POT_COLUMNS = ['ball_id', 'points']
+
+class Matches:
+    def GET(self):
+        webdata = web.input(after='', before='', limit='')
+        limit = getLimit(webdata.limit)
+
+        return respond(('matches', webdata.after, webdata.before, limit), lambda: self.build(webdata.after, webdata.before, limit))
+
+    def build(self, after, before, limit):
+        page = tmatch.getMatchPage(after=after, before=before, limit=limit)
+        page['matches'] = [encodeMatch(match) for match in page['matches']]
+
+        return page, [cache.AGGREGATE]
+
+class Match:
+    def GET(self, match_id):
+        webdata = web.input(breaks='')
+        breaks = (webdata.breaks == '1')
+
+        return respond(('match', match_id, breaks), lambda: self.build(match_id, breaks))
+
+    def build(self, match_id, breaks):
+        try:
+            match = tmatch.getMatch(match_id)
+        except IndexError:
+            raise notFound('No match %s' % match_id)
+
+        frame_breaks = {}
+        if breaks:
+            frame_breaks = breakpot.getMatchBreaks(match_id)
+
+        match = encodeMatch(match)
+        match['frames'] = [encodeFrame(frame, frame_breaks.get(frame['frame_id'], []) if breaks else None) for frame in match['frames']]
+
+        return match, [cache.match_tag(match['match_id']), cache.RECORDS]
+
+class Frame:
+    def GET(self, frame_id):
+        return respond(('frame', frame_id), lambda: self.build(frame_id))
+
+    def build(self, frame_id):
+        frame = tframe.getBasicFrameInfo(frame_id)
+        if not frame:
+            raise notFound('No frame %s' % frame_id)
+
+        return encodeFrame(frame, breakpot.getFrameBreaks(frame_id)), [cache.match_tag(frame['match_id'])]
+
+class Players:
+    def GET(self):
+        webdata = web.input(f="2000-01-01", t="9999-12-31")
+
+        return respond(('players', webdata.f, webdata.t), lambda: self.build(webdata.f, webdata.t))
+
+    def build(self, from_date, to_date):
+        return {'players':tplayer.getAllPlayers(from_date, to_date)}, [cache.AGGREGATE]
+
+class Player:
+    def GET(self, name):
+        webdata = web.input(after='', before='', limit='')
+        limit = getLimit(webdata.limit)
+
+        return respond(('player', name.lower(), webdata.after, webdata.before, limit), lambda: self.build(name, webdata.after, webdata.before, limit))
+
+    def build(self, name, after, before, limit):
+        player = tplayer.getPlayerStats(name)
+        if player is None:
+            raise notFound('No player %s' % name)
+
+        page = tmatch.getMatchPage(name, after=after, before=before, limit=limit)
+        page['matches'] = [encodeMatch(match) for match in page['matches']]
+        page['player'] = player
+
+        return page, [cache.player_tag(name)]
+
+class PlayerStats:
+    def GET(self):
+        webdata = web.input(f="2000-01-01", t=tools.subtractFromDate(), d="")
+        from_date, to_date = getStatsWindow(webdata.f, webdata.t, webdata.d)
+
+        web.header('Content-Type', CONTENT_TYPE, unique=True)
+        web.header('Cache-Control', 'no-cache')
+        cache.conditional(cache.dataETag(str(from_date), str(to_date)), None)
+
+        # the same results as the stats page, so either one warms the other
+        players, ball_stats, balls = cache.result(('stats', str(from_date), str(to_date)), lambda: Stats.load(from_date, to_date))
+
+        return encode({'from':str(from_date), 'to':str(to_date), 'players':players, 'ball_stats':ball_stats, 'balls':balls})
+
+# Overview: Returns a cached response, or builds and caches it (cache.page sends the ETag and answers If-None-Match)
+# Parameters: key (endpoint and parameters), build (function returning (data, [] of cache tags))
+# Returns: JSON body
+def respond(key, build):
+    web.header('Content-Type', CONTENT_TYPE, unique=True)
+
+    def page():
+        data, tags = build()
+        return encode(data), tags
+
+    return cache.page(('api',) + key, page)
+
+def encode(data):
+    return json.dumps(data, separators=(',', ':'), sort_keys=True)
+
+def notFound(message):
+    return web.HTTPError('404 Not Found', {'Content-Type':CONTENT_TYPE}, encode({'error':message}))
+
+# Overview: Reads the page size asked for, keeping it between 1 and config.api_max_limit
+def getLimit(limit):
+    try:
+        limit = int(limit)
+    except ValueError:
+        return config.matches_per_page
+
+    return max(1, min(limit, config.api_max_limit))
+
+def encodeMatch(match):
+    match = dict(match)
+    match.pop('pretty_date', None)
+    return match
+
+# Overview: Returns a frame with its breaks and pots in columns (see top of file)
+# Parameters: frame (see tframe.getBasicFrameInfo), breaks ([] of breaks with pots, see breakpot.loadBreaks - None to leave them out)
+def encodeFrame(frame, breaks=None):
+    frame = dict(frame)
+    if breaks is None:
+        return frame
+
+    pots = [pot for vbreak in breaks for pot in vbreak['pots']]
+
+    frame['breaks'] = columns(breaks, BREAK_COLUMNS)
+    frame['breaks']['pots'] = [len(vbreak['pots']) for vbreak in breaks]
+    frame['pots'] = columns(pots, POT_COLUMNS)
+
+    return frame
+
+def columns(rows, names):
+    return dict((name, [row[name] for row in rows]) for name in names)
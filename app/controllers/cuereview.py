@@ -17,6 +17,7 @@ from app.utils import render
 from app.utils import formatting
 from app.utils import log
 from app.utils import tools
+from app.utils import cache
 
 from app.models import tmatch
 from app.models import tframe
@@ -47,13 +48,16 @@ class Upload:
             log.info('uploadmatch +', 'Controller')
 
             if matchcsv == "" and matchfile != {}:
-                matchcsv = matchfile.value
+                date = tmatch.getDateFromFilename(matchfile.filename)
 
-                filename = matchfile.filename
-                if 'match' in filename:
-                    date = re.findall('([0-9]*-[0-9]*-[0-9]*)', filename)[0]
+                # Stream shots straight from the uploaded file rather than reading it all into memory
+                error, match_id = tmatch.parseCsvMatchFile(matchfile.file, date)
 
-            error, match_id = tmatch.parseCsvMatch(matchcsv, date)
+                if error != "" and error != tmatch.DUPLICATE_MATCH:
+                    matchfile.file.seek(0)
+                    matchcsv = matchfile.file.read() # refill the form so the csv can be fixed
+            else:
+                error, match_id = tmatch.parseCsvMatch(matchcsv, date)
 
             log.info('uploadmatch -', 'Controller')
         else:
@@ -64,6 +68,8 @@ class Upload:
         # Stay on upload page if error
         if error == "":
             raise web.seeother('/matches/'+str(match_id))
+        elif error == tmatch.DUPLICATE_MATCH:
+            return render.wrap(view.cr_upload(existing_match_id=match_id), title=title, error=error)
         else:
             return render.wrap(view.cr_upload(defaultcsv=matchcsv), title=title, error=error)
 
@@ -72,109 +78,174 @@ class Stats:
         error = ""
 
         webdata = web.input(f="2000-01-01", t=tools.subtractFromDate(), d="")
-        from_date = webdata.f
-        to_date = webdata.t
         duration = webdata.d
+        from_date, to_date = getStatsWindow(webdata.f, webdata.t, duration)
 
-        if duration == "week":
-            from_date = tools.subtractFromDate(weeks=1)
-        elif duration == "month":
-            from_date = tools.subtractFromDate(months=1)
-        elif duration == "threemonths":
-            from_date = tools.subtractFromDate(months=3)
-        elif duration == "sixmonths":
-            from_date = tools.subtractFromDate(months=6)
-        elif duration == "year":
-            from_date = tools.subtractFromDate(years=1)
-
-        players = tplayer.getAllPlayers(from_date, to_date)
-        ball_stats = tball.getBallStats(from_date, to_date)
-        balls = tball.getAllBalls()
+        # the page only changes with the data, so a browser that sends this ETag back has it already
+        web.header('Cache-Control', 'no-cache')
+        cache.conditional(cache.dataETag(str(from_date), str(to_date), duration), None)
 
+        players, ball_stats, balls = cache.result(('stats', str(from_date), str(to_date)), lambda: self.load(from_date, to_date))
 
         title = "Stats"
         breadcrumbs = [('stats', 'Stats'), ('stats/players', 'Players')]
         return render.wrap(view.cr_stats(players=players, ball_stats=ball_stats, balls=balls, d=duration), title=title, breadcrumbs=breadcrumbs, error=error)
 
+    @staticmethod
+    def load(from_date, to_date):
+        players = tplayer.getAllPlayers(from_date, to_date)
+        ball_stats = tball.getBallStats(from_date, to_date)
+        balls = tball.getAllBalls()
+
+        return players, ball_stats, balls
+
+# Overview: Works out the dates the stats page covers (also used by the API)
+# Parameters: from_date, to_date, duration ('week', 'month', 'threemonths', 'sixmonths', 'year' - overrides from_date)
+# Returns: from_date, to_date
+def getStatsWindow(from_date, to_date, duration=""):
+    if duration == "week":
+        from_date = tools.subtractFromDate(weeks=1)
+    elif duration == "month":
+        from_date = tools.subtractFromDate(months=1)
+    elif duration == "threemonths":
+        from_date = tools.subtractFromDate(months=3)
+    elif duration == "sixmonths":
+        from_date = tools.subtractFromDate(months=6)
+    elif duration == "year":
+        from_date = tools.subtractFromDate(years=1)
+
+    return from_date, to_date
+
 class Matches:
     def GET(self):
+        webdata = web.input(after='', before='')
+
+        return cache.page(('matches', webdata.after, webdata.before), lambda: self.build(webdata.after, webdata.before))
+
+    def build(self, after, before):
         error = ""
 
-        matches = tmatch.getAllMatches()
+        page = tmatch.getMatchPage(after=after, before=before)
 
         title = "Matches"
-        return render.wrap(view.cr_matches(matches=matches), title=title, error=error)
+        return render.wrap(view.cr_matches(matches=page['matches'], earlier=page['earlier'], later=page['later']), title=title, error=error), [cache.AGGREGATE]
 
 class Match:
     def GET(self, match_id):
+        return cache.page(('match', match_id), lambda: self.build(match_id))
+
+    def build(self, match_id):
         error = ""
 
+        # breaks aren't loaded here, each frame fetches its own from FrameBreaks once it's on screen
         match = tmatch.getMatch(match_id)
 
-        htmlframes = []
-        for frame in match['frames']:
-            vframe = tframe.getFrame(frame['frame_id'])
-            player1id = vframe['frame_scores'][0]['player_id']
-
-            htmlbreaks = []
-            for vbreak_id in vframe['breaks']:
-                vbreak = breakpot.getBreak(vbreak_id['break_id'])
-                left = ( vbreak['player_id'] == player1id ) # Pull to the left if it's player 1, pull to right if it's player 2
-                htmlbreaks.append(view.cr_break(vbreak=vbreak, left=left))
+        # in the breaks' URL, so they can be kept by the browser until the match changes
+        version = cache.getVersion([cache.match_tag(match['match_id'])])
 
-            htmlframes.append(view.cr_frame(frame=vframe, htmlbreaks=htmlbreaks))
+        htmlframes = [view.cr_frame(frame=vframe, version=version) for vframe in match['frames']]
 
         title = match['headline']
-        return render.wrap(view.cr_match(match=match, htmlframes=htmlframes), title=title, error=error)
+        return render.wrap(view.cr_match(match=match, htmlframes=htmlframes), title=title, error=error), [cache.match_tag(match['match_id']), cache.RECORDS]
 
 class Players:
     def GET(self):
-        error = ""
-
         webdata = web.input(f="2000-01-01", t="9999-12-31")
-        from_date = webdata.f
-        to_date = webdata.t
+
+        return cache.page(('players', webdata.f, webdata.t), lambda: self.build(webdata.f, webdata.t))
+
+    def build(self, from_date, to_date):
+        error = ""
 
         players = tplayer.getAllPlayers(from_date, to_date)
         balls = tball.getAllBalls()
 
         title = "Players"
-        return render.wrap(view.cr_players(players=players, balls=balls), title=title, error=error)
+        return render.wrap(view.cr_players(players=players, balls=balls), title=title, error=error), [cache.AGGREGATE]
 
 class Player:
     def GET(self, name):
+        webdata = web.input(after='', before='')
+
+        return cache.page(('player', name.lower(), webdata.after, webdata.before), lambda: self.build(name, webdata.after, webdata.before))
+
+    def build(self, name, after, before):
         error = ""
 
         player = tplayer.getPlayerStats(name)
-        matches = tmatch.getAllMatchesForPlayer(name)
+        page = tmatch.getMatchPage(name, after=after, before=before)
         balls = tball.getAllBalls()
 
         title = name
-        return render.wrap(view.cr_player(player=player, balls=balls, matches=matches), title=title, error=error)
+        return render.wrap(view.cr_player(player=player, balls=balls, matches=page['matches'], earlier=page['earlier'], later=page['later']), title=title, error=error), [cache.player_tag(name)]
 
 
 # AJAX HANDLERS
 
-# class Frame:
-#     def GET(self, frame_id):
-#         frame = tframe.getFrame(frame_id)
-#         player1id = frame['frame_scores'][0]['player_id']
-#         #log.debug('player1id = '+str(player1id))
+class FrameBreaks:
+    def GET(self, frame_id):
+        webdata = web.input(v='')
+
+        return cache.page(('frame_breaks', frame_id), lambda: self.build(frame_id), webdata.v)
+
+    def build(self, frame_id):
+        frame = tframe.getBasicFrameInfo(frame_id)
+        frame['breaks'] = breakpot.getFrameBreaks(frame_id)
+
+        html = view.cr_frame_breaks(frame=frame)
 
-#         htmlbreaks = []
-#         for vbreak_id in frame['breaks']:
-#             vbreak = breakpot.getBreak(vbreak_id['break_id'])
-#             left = ( vbreak['player_id'] == player1id ) # Pull to the left if it's player 1, pull to right if it's player 2
-#             htmlbreaks.append(view.cr_break(vbreak=vbreak, left=left))
+        if tmatch.isConfirmed(frame['match_id']):
+            cache.immutable()
 
-#         return view.cr_frame(frame=frame, htmlbreaks=htmlbreaks)
+        return html, [cache.match_tag(frame['match_id'])]
 
 class FrameSummary:
     def GET(self, frame_id):
+        webdata = web.input(v='')
+
+        return cache.page(('frame', frame_id), lambda: self.build(frame_id), webdata.v)
+
+    def build(self, frame_id):
         frame = tframe.getFrame(frame_id)
 
-        return view.cr_frame_summary(frame=frame)
+        html = view.cr_frame_summary(frame=frame)
+
+        if tmatch.isConfirmed(frame['match_id']):
+            cache.immutable()
+
+        return html, [cache.match_tag(frame['match_id'])]
 
 class Break:
     def GET(self, break_id):
-        return view.cr_break(vbreak=breakpot.getBreak(break_id))
+        webdata = web.input(v='')
+
+        return cache.page(('break', break_id), lambda: self.build(break_id), webdata.v)
+
+    def build(self, break_id):
+        vbreak = breakpot.getBreak(break_id)
+
+        html = view.cr_break(vbreak=vbreak)
+
+        if tmatch.isConfirmed(vbreak['match_id']):
+            cache.immutable()
+
+        return html, [cache.match_tag(vbreak['match_id'])]
+
+class CacheStatus:
+    def GET(self):
+        web.header('Content-Type', 'text/plain; charset=utf-8')
+
+        stats = cache.getStats()
+        return "".join("%s %s\n" % (key, stats[key]) for key in sorted(stats))
+
+class TemplateStatus:
+    def GET(self):
+        web.header('Content-Type', 'text/plain; charset=utf-8')
+
+        stats = view.getStats()
+        lines = ["%-20s %8s %8s %10s %10s %10s\n" % ('template', 'compiles', 'renders', 'total_ms', 'mean_ms', 'max_ms')]
+        for name in sorted(stats, key=lambda name: -stats[name]['seconds']):
+            values = stats[name]
+            lines.append("%-20s %8d %8d %10.1f %10.3f %10.3f\n" % (name, values['compiles'], values['renders'],
+                values['seconds'] * 1000, values['mean_seconds'] * 1000, values['max_seconds'] * 1000))
+        return "".join(lines)
@@ -12,38 +12,73 @@ import re
 import os
 
 from config import db
-from app.models import player
 from app.models import tball
 from app.models import tframe
+from app.models import tplayer
+from app.models import framescore
 
 # Overview: Returns break
 # Parameters: break_id
-# Returns: Dictionary = {'player_id','player_name','score', 'frame_score', 'pots'}
+# Returns: Dictionary = {'player_id','player_name','match_id','score', 'frame_score', 'pots'}
 #               pots = [] of {'ball_id', 'name', 'foul', 'points'}
 def getBreak(break_id):
-    entries = list(db.query("""
-                SELECT p.name AS player_name,
-                        b.*
-                FROM tbreak b, tplayer p
-                WHERE b.player_id=p.player_id AND
-                        b.break_id=$break_id
-            """, vars={'break_id':break_id}))
+    entries = loadBreaks("b.break_id=$break_id", {'break_id':break_id})
 
-    vbreak = {}
-    if len(entries) == 1:
-        vbreak = entries[0]
-    else:
+    if len(entries) != 1:
         return {}
 
-    vbreak['pots'] = list(db.query("""
-                SELECT b.*
-                FROM tball b, tbreakpot bp
-                WHERE bp.ball_id=b.ball_id AND
-                            bp.break_id=$break_id
-                ORDER BY bp.pot_num
-            """, vars={'break_id':break_id}))
-
-    return vbreak
+    return entries[0]
+
+# Overview: Returns every break of a match with its pots (two queries however many breaks there are)
+# Parameters: match_id
+# Returns: frame_id -> [] of breaks (see getBreak), in break_num, foul_num order
+def getMatchBreaks(match_id):
+    frames = {}
+    for vbreak in loadBreaks("""b.frame_id IN (SELECT frame_id FROM tframe WHERE match_id=$match_id)""", {'match_id':match_id}):
+        frames.setdefault(vbreak['frame_id'], []).append(vbreak)
+
+    return frames
+
+# Overview: Returns every break of a frame with its pots
+# Parameters: frame_id
+# Returns: [] of breaks (see getBreak), in break order
+def getFrameBreaks(frame_id):
+    return loadBreaks("b.frame_id=$frame_id", {'frame_id':frame_id})
+
+# Overview: Loads breaks with player names and pots, one query for the breaks and one for all of their pots
+# Parameters: where (condition on tbreak b), vars for the condition
+# Returns: [] of breaks (see getBreak), ordered by frame_id, break_num, foul_num
+def loadBreaks(where, where_vars):
+    breaks = list(db.query("""
+                SELECT p.name AS player_name,
+                        f.match_id,
+                        b.*
+                FROM tbreak b, tplayer p, tframe f
+                WHERE b.player_id=p.player_id AND
+                        b.frame_id=f.frame_id AND
+                        """+where+"""
+                ORDER BY b.frame_id, b.break_num, b.foul_num
+            """, vars=where_vars))
+
+    if len(breaks) == 0:
+        return []
+
+    pots = {}
+    for pot in db.query("""
+                SELECT bp.break_id, ba.*
+                FROM tball ba, tbreakpot bp, tbreak b
+                WHERE bp.ball_id=ba.ball_id AND
+                        bp.break_id=b.break_id AND
+                        """+where+"""
+                ORDER BY bp.break_id, bp.pot_num
+            """, vars=where_vars):
+        break_id = pot.pop('break_id')
+        pots.setdefault(break_id, []).append(pot)
+
+    for vbreak in breaks:
+        vbreak['pots'] = pots.get(vbreak['break_id'], [])
+
+    return breaks
 
 # Overview: Creates empty break (used during match parsing)
 # Parameters: frame_id, break_num (to order breaks in frame)
@@ -134,6 +169,17 @@ def closeBreak(break_id):
     if rowcount != 1:
         error = "Uh oh"
 
+    # Update player stats
+    ball_ids = [pot['ball_id'] for pot in db.query("""
+                    SELECT ball_id
+                    FROM tbreakpot
+                    WHERE break_id=$break_id
+            """, vars={'break_id':break_id})]
+
+    stats = tplayer.createPlayerStats(breakx['player_id'])
+    tplayer.addBreakStats(stats, break_id, score, length, foul_entries[0]['fouls'] > 0, ball_ids)
+    tplayer.updatePlayerStats([stats])
+
 # Overview: Registers a potted ball or foul
 # Parameters: break_id, ball_name ('Red', 'Yellow' etc.), points, type ('Foul' or 'Pot')
 # Returns: ?
@@ -167,33 +213,4 @@ def pot(break_id, ball_name, points, type='Pot'):
 
 # update tbreak.frame_score and tbreak.opp_frame_score for breaks created before functionality was added
 def backpopulateCurrentFrameScores():
-    t = db.transaction()
-
-    try:
-        breaks = list(db.query("""
-                        SELECT * FROM tbreak
-                    """))
-
-        for breakx in breaks:
-            frame_score, foul_points = tframe.getCurrentFrameScore(breakx['frame_id'], breakx['player_id'], break_num=breakx['break_num'], foul_num=breakx['foul_num'])
-
-            rowcount = db.update('tbreak',
-                                    where='break_id=$break_id',
-                                    vars={'break_id':breakx['break_id']},
-                                    frame_score=frame_score)
-
-            opp_frame_score, opp_foul_points = tframe.getCurrentFrameScore(breakx['frame_id'], breakx['player_id'], break_num=breakx['break_num'], foul_num=breakx['foul_num'], opponent=True)
-
-            rowcount += db.update('tbreak',
-                                    where='break_id=$break_id',
-                                    vars={'break_id':breakx['break_id']},
-                                    opp_frame_score=opp_frame_score)
-
-            if rowcount != 2:
-                print "FUCKING HELL"
-                raise
-    except:
-        t.rollback()
-        raise
-    else:
-        t.commit()
\ No newline at end of file
+    return framescore.rebuildFrameScores()['changed']
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+bulk.py: Helpers for writing many rows in a single statement (used by match ingest).
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+from config import db
+
+
+# Overview: Inserts many rows into a table with one prepared statement.
+#           Must be called inside db.transaction(), nothing is committed here.
+# Parameters: tablename, values ([] of dictionaries, all with the same keys), replace (INSERT OR REPLACE)
+# Returns: [] of inserted ids, in the same order as values
+def insert(tablename, values, replace=False):
+    if len(values) == 0:
+        return []
+
+    keys = sorted(values[0].keys())
+
+    verb = "INSERT"
+    if replace:
+        verb = "INSERT OR REPLACE"
+
+    sql = "%s INTO %s (%s) VALUES (%s)" % (verb, tablename, ", ".join(keys), ", ".join(["?"] * len(keys)))
+
+    cursor = db._db_cursor()
+    cursor.executemany(sql, [[row[key] for key in keys] for row in values])
+
+    # rowids are handed out sequentially inside the transaction, same assumption web.py makes for multiple_insert
+    last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+    return range(last_id - len(values) + 1, last_id + 1)
+
+# Overview: Updates many rows of a table with one prepared statement.
+#           Must be called inside db.transaction(), nothing is committed here.
+# Parameters: tablename, key (column to match rows on), values ([] of dictionaries, all with the same keys, including key)
+# Returns: number of rows updated
+def update(tablename, key, values):
+    if len(values) == 0:
+        return 0
+
+    keys = sorted(k for k in values[0].keys() if k != key)
+
+    sql = "UPDATE %s SET %s WHERE %s=?" % (tablename, ", ".join(k+"=?" for k in keys), key)
+
+    cursor = db._db_cursor()
+    cursor.executemany(sql, [[row[k] for k in keys] + [row[key]] for row in values])
+
+    return cursor.rowcount
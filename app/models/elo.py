@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+elo.py: Replays elo ratings over frames in memory, writing tplayer.elo, telojrnl and tframe.result_probability in bulk.
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+from config import db
+
+from app.utils import log
+from app.utils import cache
+from app.models import bulk
+from app.models import tplayer
+
+# matches that come after a point (date, match_id) in the order elo is applied
+# (the date on its own lets sqlite use the tmatch_date index, and CROSS JOIN makes it start from tmatch)
+AFTER = "m.date >= $date AND (m.date, m.match_id) > ($date, $match_id)"
+
+
+# Overview: Loads the frames with a winner and a loser in the order elo is applied to them
+#           (match date, then upload order)
+# Parameters: date, match_id (optional - only frames of matches after this point)
+# Returns: [] of {'frame_id', 'match_id', 'date', 'winner_id', 'loser_id'}
+def getEloFrames(date=None, match_id=None):
+    where = ""
+    if date is not None:
+        where = "WHERE "+AFTER
+
+    return list(db.query("""
+                    SELECT f.frame_id, m.match_id, m.date, w.player_id as winner_id, l.player_id as loser_id
+                    FROM tmatch m
+                        CROSS JOIN tframe f ON f.match_id=m.match_id
+                        JOIN tframescore w ON w.frame_id=f.frame_id AND w.won=1
+                        JOIN tframescore l ON l.frame_id=f.frame_id AND l.won=0
+                    """+where+"""
+                    ORDER BY m.date, m.match_id, f.frame_id
+            """, vars={'date':date, 'match_id':match_id}))
+
+# Overview: Rewinds the ratings of players who played after a point in the order, using the opponent's elo
+#           kept in telojrnl against them in their first frame after it
+# Parameters: date, match_id
+# Returns: player_id -> elo just before the point (only players with frames after it)
+def getElosBefore(date, match_id):
+    elos = {}
+
+    for jrnl in db.query("""
+                    SELECT j.player_id, opp.opp_elo
+                    FROM tmatch m
+                        CROSS JOIN tframe f ON f.match_id=m.match_id
+                        JOIN telojrnl j ON j.frame_id=f.frame_id
+                        JOIN telojrnl opp ON opp.frame_id=f.frame_id AND opp.player_id<>j.player_id
+                    WHERE """+AFTER+"""
+                    ORDER BY m.date, m.match_id, f.frame_id
+            """, vars={'date':date, 'match_id':match_id}):
+        if jrnl['player_id'] not in elos:
+            elos[jrnl['player_id']] = jrnl['opp_elo']
+
+    return elos
+
+# Overview: Applies elo changes to frames in order without touching the database (see tplayer.updateElo)
+# Parameters: frames (from getEloFrames), elos (player_id -> elo, changed in place, missing players start at
+#             tplayer.start_elo), elo_f, elo_k (default to tplayer.f and tplayer.k)
+# Returns: {'jrnl': [] of telojrnl rows, 'probabilities': [] of {'frame_id', 'result_probability'}}
+def applyElo(frames, elos, elo_f=None, elo_k=None):
+    jrnl = []
+    probabilities = []
+
+    for vframe in frames:
+        winner_id = vframe['winner_id']
+        loser_id = vframe['loser_id']
+
+        winner_elo = elos.setdefault(winner_id, tplayer.start_elo)
+        loser_elo = elos.setdefault(loser_id, tplayer.start_elo)
+
+        # the result probability is always the winner's chance of winning (see tframe.closeFrame)
+        probability = tplayer.getProbability(winner_elo, loser_elo, elo_f)
+        change = tplayer.getEloChange(probability, elo_k)
+
+        probabilities.append({'frame_id':vframe['frame_id'], 'result_probability':probability})
+
+        for player_id, elo_change, opp_elo in [(winner_id, change, loser_elo), (loser_id, -change, winner_elo)]:
+            elos[player_id] = elos[player_id] + elo_change
+            jrnl.append({'player_id':player_id,
+                            'frame_id':vframe['frame_id'],
+                            'elo_change':elo_change,
+                            'opp_elo':opp_elo,
+                            'new_elo':elos[player_id]})
+
+    return {'jrnl':jrnl, 'probabilities':probabilities}
+
+# Overview: Replays the frames after a point in the order (e.g. after a back-dated upload), rewriting their
+#           telojrnl entries and result probabilities and the players' ratings.
+#           Must be called inside db.transaction(), nothing is committed here.
+# Parameters: date, match_id, elos_before (from getElosBefore), elos (player_id -> elo at the point, for players
+#             whose rating there has changed)
+# Returns: [] of player_id whose ratings were written (everyone who plays after the point, and the players in elos)
+# Update: tplayer, tframe
+# Insert: telojrnl
+def replayAfter(date, match_id, elos_before, elos):
+    frames = getEloFrames(date, match_id)
+
+    ratings = dict(elos_before)
+    ratings.update(elos)
+    changes = applyElo(frames, ratings)
+
+    db.query("""
+                DELETE FROM telojrnl
+                WHERE frame_id IN (SELECT f.frame_id
+                                    FROM tmatch m, tframe f
+                                    WHERE f.match_id=m.match_id AND
+                                        """+AFTER+""")
+            """, vars={'date':date, 'match_id':match_id})
+
+    bulk.insert('telojrnl', changes['jrnl'])
+    bulk.update('tframe', 'frame_id', changes['probabilities'])
+    bulk.update('tplayer', 'player_id', [{'player_id':player_id, 'elo':elo} for player_id, elo in ratings.items()])
+
+    log.info('replayAfter(%s, %s) : %s frames', 'elo', date, match_id, len(frames))
+    return sorted(ratings.keys())
+
+# Overview: Works out every player's elo from scratch by replaying every frame in date order, then writes the
+#           ratings, telojrnl and result probabilities in one transaction
+# Parameters: elo_f, elo_k (default to tplayer.f and tplayer.k), dry_run (only work out the ratings)
+# Returns: {'frames', 'ratings': player_id -> elo}
+# Update: tplayer, tframe
+# Insert: telojrnl
+def replayElo(elo_f=None, elo_k=None, dry_run=False):
+    elos = dict((player['player_id'], tplayer.start_elo) for player in db.query("SELECT player_id FROM tplayer"))
+
+    frames = getEloFrames()
+    changes = applyElo(frames, elos, elo_f, elo_k)
+
+    if not dry_run:
+        t = db.transaction()
+        try:
+            db.query("DELETE FROM telojrnl")
+            bulk.insert('telojrnl', changes['jrnl'])
+            bulk.update('tframe', 'frame_id', changes['probabilities'])
+            bulk.update('tplayer', 'player_id', [{'player_id':player_id, 'elo':elo} for player_id, elo in elos.items()])
+
+            cache.clear()
+        except:
+            t.rollback()
+            log.error('Failed to write replayed elo ratings', 'elo')
+            raise
+        else:
+            t.commit()
+
+    return {'frames':len(frames), 'ratings':elos}
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+framescore.py: Running frame score kept in memory while a frame is built, so each break is scored without
+querying the breaks before it. tframe.getCurrentFrameScore is the SQL version and is used to check this one.
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+from config import db
+
+from app.utils import cache
+from app.models import tframe
+from app.models import bulk
+
+
+class FrameScore:
+    def __init__(self):
+        self.players = []       # in order of first break, same as SELECT distinct player_id FROM tbreak
+        self.points = {}        # player_id -> points from their non-foul breaks
+        self.foul_points = {}   # player_id -> points given away in their foul breaks
+        self.foul_nums = {}     # break_num -> highest foul_num so far
+        self.total_points = 0
+        self.total_foul_points = 0
+
+    # Overview: Adds a player to the frame (when their first break starts)
+    def addPlayer(self, player_id):
+        if player_id not in self.points:
+            self.players.append(player_id)
+            self.points[player_id] = 0
+            self.foul_points[player_id] = 0
+
+    # Overview: Adds a closed break (see breakpot.closeBreak)
+    # Parameters: player_id, break_num, score, foul (True if a foul was potted in the break)
+    # Returns: foul_num (None if it isn't a foul), frame_score, opp_frame_score
+    def addBreak(self, player_id, break_num, score, foul):
+        self.addPlayer(player_id)
+
+        frame_score = self.getScore(player_id)[0]
+        opp_frame_score = self.getScore(player_id, opponent=True)[0]
+
+        foul_num = None
+        if foul:
+            foul_num = self.foul_nums.get(break_num, 0) + 1
+            self.foul_nums[break_num] = foul_num
+            self.foul_points[player_id] += score
+            self.total_foul_points += score
+        else:
+            frame_score += score
+            self.points[player_id] += score
+            self.total_points += score
+
+        return foul_num, frame_score, opp_frame_score
+
+    # Overview: Gets the frame score and foul points of a player from the breaks added so far (see tframe.getCurrentFrameScore)
+    # Parameters: player_id, opponent determines whether to get the player's opponent's score
+    # Returns: tuple of (player score, foul_points)
+    def getScore(self, player_id, opponent=False):
+        points = self.points.get(player_id, 0)
+        foul_points = self.foul_points.get(player_id, 0)
+
+        # a player scores their own breaks plus whatever the other player gives away in fouls
+        if opponent:
+            return (self.total_points - points) + foul_points, self.total_foul_points - foul_points
+
+        return points + (self.total_foul_points - foul_points), foul_points
+
+
+# Overview: Replays frames from tbreak through FrameScore, in the order their breaks were closed
+# Parameters: frame_ids (optional - defaults to every frame)
+# Returns: generator of (frame_id, FrameScore, [] of (break row, (foul_num, frame_score, opp_frame_score)))
+def replayFrames(frame_ids=None):
+    where = ""
+    if frame_ids is not None:
+        if len(frame_ids) == 0:
+            return
+        where = "WHERE frame_id IN $frame_ids"
+
+    rows = db.query("""
+                    SELECT break_id, frame_id, break_num, player_id, IFNULL(score, 0) as score, foul_num, frame_score, opp_frame_score
+                    FROM tbreak
+                    """+where+"""
+                    ORDER BY frame_id, break_id
+            """, vars={'frame_ids':frame_ids})
+
+    frame_id = None
+    for vbreak in rows:
+        if vbreak['frame_id'] != frame_id:
+            if frame_id is not None:
+                yield frame_id, score, breaks
+            frame_id = vbreak['frame_id']
+            score = FrameScore()
+            breaks = []
+
+        breaks.append((vbreak, score.addBreak(vbreak['player_id'], vbreak['break_num'], vbreak['score'], vbreak['foul_num'] is not None)))
+
+    if frame_id is not None:
+        yield frame_id, score, breaks
+
+# Overview: Recalculates frame_score and opp_frame_score of every break in one pass per frame, writing only the
+#           rows that change (replaces breakpot.backpopulateCurrentFrameScores)
+# Parameters: frame_ids (optional - defaults to every frame)
+# Returns: {'frames', 'breaks', 'changed'}
+# Update: tbreak
+def rebuildFrameScores(frame_ids=None):
+    report = {'frames':0, 'breaks':0, 'changed':0}
+    changes = []
+    changed_frames = set()
+
+    for frame_id, score, breaks in replayFrames(frame_ids):
+        for vbreak, (foul_num, frame_score, opp_frame_score) in breaks:
+            if (frame_score, opp_frame_score) != (vbreak['frame_score'], vbreak['opp_frame_score']):
+                changes.append({'break_id':vbreak['break_id'],
+                                'frame_score':frame_score,
+                                'opp_frame_score':opp_frame_score})
+                changed_frames.add(frame_id)
+
+        report['frames'] += 1
+        report['breaks'] += len(breaks)
+
+    t = db.transaction()
+    try:
+        report['changed'] = bulk.update('tbreak', 'break_id', changes)
+
+        if len(changed_frames) > 0:
+            cache.invalidate([cache.match_tag(row['match_id']) for row in db.query("""
+                    SELECT DISTINCT match_id FROM tframe WHERE frame_id IN $frame_ids
+                """, vars={'frame_ids':sorted(changed_frames)})])
+    except:
+        t.rollback()
+        raise
+    else:
+        t.commit()
+
+    return report
+
+# Overview: Replays frames through FrameScore and checks them against the stored break scores and against
+#           tframe.getCurrentFrameScore for the frame totals
+# Parameters: frame_ids (optional - defaults to every frame)
+# Returns: {'frames', 'breaks', 'mismatches': [] of strings}
+def checkFrameScores(frame_ids=None):
+    report = {'frames':0, 'breaks':0, 'mismatches':[]}
+
+    for frame_id, score, breaks in replayFrames(frame_ids):
+        for vbreak, (foul_num, frame_score, opp_frame_score) in breaks:
+            if (foul_num, frame_score, opp_frame_score) != (vbreak['foul_num'], vbreak['frame_score'], vbreak['opp_frame_score']):
+                report['mismatches'].append("break %d: stored (%s, %s, %s), FrameScore (%s, %s, %s)" % (vbreak['break_id'],
+                        vbreak['foul_num'], vbreak['frame_score'], vbreak['opp_frame_score'], foul_num, frame_score, opp_frame_score))
+
+        for player_id in score.players:
+            for opponent in [False, True]:
+                expected = tframe.getCurrentFrameScore(frame_id, player_id, opponent=opponent)
+                if score.getScore(player_id, opponent) != expected:
+                    report['mismatches'].append("frame %d player %d%s: getCurrentFrameScore %s, FrameScore %s" % (frame_id,
+                            player_id, " (opponent)" if opponent else "", expected, score.getScore(player_id, opponent)))
+
+        report['frames'] += 1
+        report['breaks'] += len(breaks)
+
+    return report
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+importer.py: Bulk import of exported csv matches. Files are parsed in a process pool and written by a single writer.
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+import os
+import glob
+import time
+import datetime
+import multiprocessing
+
+from config import db
+
+from app.utils import log
+from app.models import tmatch
+
+
+# Overview: Expands directories and glob patterns into a list of csv files
+# Parameters: [] of directories / glob patterns / filenames
+# Returns: [] of filenames
+def findMatchFiles(paths):
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(glob.glob(os.path.join(path, 'match_*.csv')))
+        else:
+            filenames.extend(glob.glob(path))
+
+    return sorted(set(filenames))
+
+# fingerprints of matches already in the database, set in each worker by setKnownFingerprints
+known_fingerprints = set()
+
+# Overview: Pool initializer, gives the workers the fingerprints that are already imported
+def setKnownFingerprints(fingerprints):
+    global known_fingerprints
+    known_fingerprints = fingerprints
+
+# Overview: Reads and validates a single csv file (runs in a worker process, doesn't touch the database).
+#           Files that have already been imported are flagged as known without building their shots.
+# Parameters: (filename, date)
+# Returns: {'filename', 'date', 'error', 'known', 'fingerprint', 'shots', 'player_names'}
+def readMatchFile(args):
+    filename, date = args
+    result = {'filename':filename, 'date':date, 'error':'', 'known':False, 'fingerprint':'', 'shots':[], 'player_names':[]}
+
+    try:
+        with open(filename, 'rb') as f:
+            result['error'], column_headers, result['player_names'], result['fingerprint'] = tmatch.checkCsvMatch(f)
+
+            if result['error'] == '':
+                if result['fingerprint'] in known_fingerprints:
+                    result['known'] = True
+                else:
+                    f.seek(0)
+                    result['shots'] = list(tmatch.iterCsvShots(f, column_headers))
+    except Exception, e:
+        result['error'] = str(e)
+
+    return result
+
+# Overview: Imports csv files in date order. Parsing happens in a process pool, this process is the only writer.
+# Parameters: filenames, processes (defaults to number of cpus), batch_size (matches per transaction),
+#               progress (optional function called with the report after every batch)
+# Returns: {'files', 'imported', 'shots', 'skipped', 'rejected', 'elapsed'}
+#       skipped: [] of filenames that were already imported (same fingerprint)
+#       rejected: [] of (filename, error)
+def importFiles(filenames, processes=None, batch_size=50, progress=None):
+    start = time.time()
+    report = {'files':len(filenames), 'imported':0, 'shots':0, 'skipped':[], 'rejected':[], 'elapsed':0.0}
+
+    # Dates come from the filename the same way Upload.POST does it, files without one go in as today
+    today = datetime.date.today().strftime("%Y-%m-%d")
+    dated = []
+    for filename in filenames:
+        dated.append((filename, tmatch.getDateFromFilename(os.path.basename(filename))))
+
+    dated.sort(key=lambda entry: (entry[1] or today, entry[0]))
+
+    log.info('importFiles(%s files) +', 'importer', len(dated))
+
+    known = tmatch.getAllFingerprints()
+
+    pool = multiprocessing.Pool(processes, setKnownFingerprints, (known,))
+    try:
+        batch = []
+        # imap keeps date order, so the writer can start on early matches while later files are still parsing
+        for result in pool.imap(readMatchFile, dated, chunksize=4):
+            if result['error'] != '':
+                report['rejected'].append((result['filename'], result['error']))
+                continue
+
+            # known to the workers, or the same csv twice in this run
+            if result['known'] or result['fingerprint'] in known:
+                report['skipped'].append(result['filename'])
+                continue
+            known.add(result['fingerprint'])
+
+            batch.append(result)
+            if len(batch) >= batch_size:
+                writeBatch(batch, report)
+                batch = []
+                report['elapsed'] = time.time() - start
+                if progress is not None:
+                    progress(report)
+
+        if len(batch) > 0:
+            writeBatch(batch, report)
+    finally:
+        pool.close()
+        pool.join()
+
+    report['elapsed'] = time.time() - start
+    if progress is not None:
+        progress(report)
+
+    log.info('importFiles - %s imported, %s rejected', 'importer', report['imported'], len(report['rejected']))
+
+    return report
+
+# Overview: Writes a batch of parsed matches in one transaction. sqlite can't do savepoints through web.py, so if
+#           any match fails the batch is rolled back and written again one match per transaction.
+# Parameters: batch ([] of results from readMatchFile), report (updated in place)
+# Insert: see tmatch.createCsvMatch
+def writeBatch(batch, report):
+    failed = False
+
+    with db.writing():
+        t = db.transaction()
+        db.ctx.ignore_nested_transactions = True
+        try:
+            for match in batch:
+                error, match_id = tmatch.createCsvMatch(match['shots'], match['player_names'], match['date'], match['fingerprint'])
+                if error != '':
+                    failed = True
+                    break
+        except:
+            t.rollback()
+            raise
+        else:
+            if failed:
+                t.rollback()
+            else:
+                t.commit()
+        finally:
+            db.ctx.ignore_nested_transactions = False
+
+    if failed:
+        log.error('writeBatch - batch failed, retrying one match at a time', 'importer')
+
+    for match in batch:
+        error = ''
+        if failed:
+            error, match_id = tmatch.createCsvMatch(match['shots'], match['player_names'], match['date'], match['fingerprint'])
+
+        if error != '':
+            report['rejected'].append((match['filename'], error))
+        else:
+            report['imported'] += 1
+            report['shots'] += len(match['shots'])
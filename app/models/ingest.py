@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+"""
+ingest.py: Builds a match in memory from parsed csv shots and writes it a frame at a time with bulk inserts.
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+from config import db
+
+from app.utils import log
+from app.models import bulk
+from app.models import tball
+from app.models import tplayer
+from app.models import trecord
+from app.models import elo
+from app.models.framescore import FrameScore
+
+
+# Overview: Works out a match frame by frame in memory and writes it. Rows written are the same as the old per-shot path
+#           (createFrame, createBreak, pot, closeBreak, closeFrame, closeMatch) would have produced.
+#           Each frame is written as soon as it's closed, so only one frame of shots is held at a time.
+#           Must be called inside db.transaction().
+# Parameters: match_id (already created), shots (list or generator of shot dictionaries), player_ids (name -> player_id)
+# Returns: [] of player_id of other players whose ratings were replayed (a back-dated match, see elo.replayAfter)
+# Insert: tframe, tbreak, tbreakpot, tframescore, tmatchscore, telojrnl, trecord
+# Update: tplayer, tplayerstats
+def ingestMatch(match_id, shots, player_ids):
+    log.info('ingestMatch(%s) +', 'ingest', match_id)
+
+    match = createMatch(match_id, player_ids)
+
+    for vframe in buildFrames(match, shots, player_ids):
+        writeFrame(match, match_id, vframe)
+
+    closeMatch(match)
+    replayed = writeMatch(match_id, match)
+
+    log.info('ingestMatch -', 'ingest')
+
+    return [player_id for player_id in replayed if player_id not in player_ids.values()]
+
+# Overview: Starts the in-memory state kept for the whole match
+# Parameters: match_id, player_ids
+# Returns: {'date', 'balls', 'elos', 'later_elos', 'frame_scores', 'match_scores', 'stray_pots', 'player_stats', 'frames'}
+#       balls: {(name, foul): {'ball_id', 'name', 'foul', 'points'}}
+#       elos: player_id -> current elo (as of the match date)
+#       later_elos: player_id -> elo before their first frame after this match (see elo.getElosBefore)
+#       frame_scores: [] of every frame score so far (for closeMatch)
+#       stray_pots: [] of ball_id for pots that the old path registered against break_id 0
+#       player_stats: player_id -> changes to tplayerstats (see tplayer.createPlayerStats)
+#       frames: number of frames written
+def createMatch(match_id, player_ids):
+    match = {'balls':tball.getOrCreateBalls([]), 'elos':{}, 'frame_scores':[], 'match_scores':[], 'stray_pots':[],
+                'player_stats':{}, 'frames':0}
+
+    match['date'] = list(db.query("""
+                    SELECT date FROM tmatch WHERE match_id=$match_id
+            """, vars={'match_id':match_id}))[0]['date']
+
+    # a back-dated match starts from the ratings its players had on that date, and the frames after it are replayed
+    match['later_elos'] = elo.getElosBefore(match['date'], match_id)
+
+    for player_id in player_ids.values():
+        if player_id in match['later_elos']:
+            match['elos'][player_id] = match['later_elos'][player_id]
+        else:
+            match['elos'][player_id] = tplayer.getBasicPlayerInfo(player_id)['elo']
+
+    return match
+
+# Overview: Works out every row of each frame without touching the database (apart from creating new balls)
+# Parameters: match (from createMatch), shots, player_ids
+# Returns: generator of closed frames, each {'frame_num', 'score' (FrameScore), 'breaks', 'frame_scores', 'result_probability', 'elo_jrnl'}
+#       breaks: [] of {'break_num', 'player_id', 'pots', 'score', 'foul_num', 'length', 'frame_score', 'opp_frame_score'}
+#       frame_scores: [] of {'player_id', 'won', 'score', 'foul_points'}
+#       elo_jrnl: [] of {'player_id', 'elo_change', 'opp_elo', 'new_elo'}
+def buildFrames(match, shots, player_ids):
+    # Same walk over the shots as the old per-shot loop, so odd csvs end up the same way
+    cur_frame = 0
+    cur_break = 0
+    vframe = None
+    vbreak = None
+
+    for shot in shots:
+        cur_player_id = player_ids[shot['PLAYER']]
+
+        if shot['FRAME'] != cur_frame: # New frame
+            if vbreak is not None:
+                closeBreak(vframe, vbreak)
+                vbreak = None
+            if vframe is not None:
+                closeFrame(match, vframe)
+                yield vframe
+            cur_frame = shot['FRAME']
+            vframe = createFrame(cur_frame)
+
+        if shot['BREAK'] != cur_break or shot['BREAK'] == '': # New break
+            if vbreak is not None:
+                closeBreak(vframe, vbreak)
+            if shot['BREAK'] != '':
+                cur_break = shot['BREAK']
+            vbreak = createBreak(vframe, cur_break, cur_player_id)
+
+        # Register shot
+        ball = getBall(match, shot['BALL'], shot['POINTS'], getFoul(shot['TYPE']))
+        if vbreak is None:
+            match['stray_pots'].append(ball['ball_id'])
+        else:
+            vbreak['pots'].append(ball)
+
+    if vbreak is not None:
+        closeBreak(vframe, vbreak)
+
+    if vframe is not None:
+        closeFrame(match, vframe)
+        yield vframe
+
+# Overview: Writes a closed frame, one bulk insert per table, and adds it to the match's player stats and the records
+# Parameters: match, match_id, frame (from buildFrames)
+# Insert: tframe, tbreak, tbreakpot, tframescore, telojrnl, trecord
+def writeFrame(match, match_id, vframe):
+    frame_id = bulk.insert('tframe', [{'match_id':match_id,
+                                        'frame_num':vframe['frame_num'],
+                                        'result_probability':vframe['result_probability']}])[0]
+
+    break_ids = bulk.insert('tbreak', [{'frame_id':frame_id,
+                                        'break_num':vbreak['break_num'],
+                                        'player_id':vbreak['player_id'],
+                                        'score':vbreak['score'],
+                                        'foul_num':vbreak['foul_num'],
+                                        'length':vbreak['length'],
+                                        'frame_score':vbreak['frame_score'],
+                                        'opp_frame_score':vbreak['opp_frame_score']}
+                                            for vbreak in vframe['breaks']])
+
+    pots = []
+    for break_id, vbreak in zip(break_ids, vframe['breaks']):
+        pot_num = 0
+        for ball in vbreak['pots']:
+            pot_num += 1
+            pots.append({'break_id':break_id, 'pot_num':pot_num, 'ball_id':ball['ball_id']})
+
+    bulk.insert('tbreakpot', pots)
+
+    bulk.insert('tframescore', [dict(frame_score, frame_id=frame_id) for frame_score in vframe['frame_scores']])
+
+    bulk.insert('telojrnl', [dict(jrnl, frame_id=frame_id) for jrnl in vframe['elo_jrnl']])
+
+    # ids are only known now, so this is where breaks and frames go into the stats
+    for break_id, vbreak in zip(break_ids, vframe['breaks']):
+        tplayer.addBreakStats(getPlayerStats(match, vbreak['player_id']), break_id, vbreak['score'], vbreak['length'],
+                                vbreak['foul_num'] is not None, [ball['ball_id'] for ball in vbreak['pots']])
+
+    for frame_score in vframe['frame_scores']:
+        tplayer.addFrameStats(getPlayerStats(match, frame_score['player_id']), frame_id, frame_score['won'],
+                                frame_score['score'], frame_score['foul_points'])
+
+    trecord.addRecords(trecord.getFrameRecords(match['date'], match_id, frame_id, vframe['frame_scores'],
+                                                [dict(vbreak, break_id=break_id) for break_id, vbreak in zip(break_ids, vframe['breaks'])]))
+
+    match['frames'] += 1
+
+# Overview: Writes what's left once every frame is written: match scores, stray pots, new elo ratings, player stats
+#           and the most frames record
+# Parameters: match_id, match
+# Returns: [] of player_id whose ratings were replayed (see elo.replayAfter)
+# Insert: tmatchscore, tbreakpot, trecord
+# Update: tplayer, tplayerstats
+def writeMatch(match_id, match):
+    if len(match['stray_pots']) > 0:
+        pot_num = list(db.query("""
+                        SELECT IFNULL(MAX(pot_num), 0) as pot_num
+                        FROM tbreakpot
+                        WHERE break_id=0
+                """))[0]['pot_num']
+
+        pots = []
+        for ball_id in match['stray_pots']:
+            pot_num += 1
+            pots.append({'break_id':0, 'pot_num':pot_num, 'ball_id':ball_id})
+
+        bulk.insert('tbreakpot', pots)
+
+    bulk.insert('tmatchscore', [dict(match_score, match_id=match_id) for match_score in match['match_scores']])
+
+    replayed = []
+    if len(match['frame_scores']) > 0:
+        if len([player_id for player_id in match['elos'] if player_id in match['later_elos']]) > 0:
+            replayed = elo.replayAfter(match['date'], match_id, match['later_elos'], match['elos'])
+        else:
+            bulk.update('tplayer', 'player_id', [{'player_id':player_id, 'elo':rating}
+                                                    for player_id, rating in match['elos'].items()])
+
+    for match_score in match['match_scores']:
+        tplayer.addMatchStats(getPlayerStats(match, match_score['player_id']), match_score['won'])
+
+    tplayer.updatePlayerStats(match['player_stats'].values())
+
+    trecord.addRecords([trecord.createRecord('most_frames', match['date'], match['frames'], match_id)])
+
+    return replayed
+
+# Overview: Gets the changes to a player's stats for this match, starting them if needed
+# Parameters: match, player_id
+# Returns: see tplayer.createPlayerStats
+def getPlayerStats(match, player_id):
+    if player_id not in match['player_stats']:
+        match['player_stats'][player_id] = tplayer.createPlayerStats(player_id)
+
+    return match['player_stats'][player_id]
+
+# Overview: Looks up a ball, creating it the first time it's seen (same as tball.getOrCreateBall)
+# Parameters: match, ball name, points, foul
+# Returns: {'ball_id', 'name', 'foul', 'points'}
+def getBall(match, name, points, foul):
+    if (name, foul) not in match['balls']:
+        match['balls'] = tball.getOrCreateBalls([(name, points, foul)])
+
+    return match['balls'][(name, foul)]
+
+# Overview: Starts an in-memory frame
+# Parameters: frame_num
+# Returns: frame dictionary
+def createFrame(frame_num):
+    return {'frame_num':frame_num,
+            'breaks':[],
+            'frame_scores':[],
+            'result_probability':None,
+            'elo_jrnl':[],
+            'score':FrameScore()}   # running scores of the breaks closed so far
+
+# Overview: Starts an in-memory break
+# Parameters: frame (from createFrame), break_num, player_id
+# Returns: break dictionary
+def createBreak(vframe, break_num, player_id):
+    vbreak = {'break_num':break_num,
+                'player_id':player_id,
+                'pots':[],
+                'score':None,
+                'foul_num':None,
+                'length':None,
+                'frame_score':None,
+                'opp_frame_score':None}
+
+    vframe['score'].addPlayer(player_id)
+
+    vframe['breaks'].append(vbreak)
+
+    return vbreak
+
+# Overview: Works out break score, length, foul_num and running frame scores (see breakpot.closeBreak)
+# Parameters: frame, break
+def closeBreak(vframe, vbreak):
+    vbreak['score'] = sum(ball['points'] for ball in vbreak['pots'])
+    vbreak['length'] = len(vbreak['pots'])
+
+    foul = len([ball for ball in vbreak['pots'] if ball['foul'] == 'Y']) > 0
+
+    vbreak['foul_num'], vbreak['frame_score'], vbreak['opp_frame_score'] = vframe['score'].addBreak(vbreak['player_id'],
+                                                                            vbreak['break_num'], vbreak['score'], foul)
+
+# Overview: Works out frame scores, result probability and elo changes (see tframe.closeFrame)
+# Parameters: match, frame
+def closeFrame(match, vframe):
+    players = vframe['score'].players
+
+    if len(players) != 2:
+        log.error('Bad number of players returned ('+str(len(players))+') while closing frame')
+        return
+
+    elos = match['elos']
+
+    scores = [vframe['score'].getScore(player_id) for player_id in players]
+
+    probability = tplayer.getProbability(elos[players[0]], elos[players[1]])
+
+    won = True # player 0 wins by default
+    if scores[1][0] > scores[0][0]:
+        won = False
+        probability = tplayer.getProbability(elos[players[1]], elos[players[0]])
+
+    vframe['result_probability'] = probability
+
+    for player_id, score, player_won in zip(players, scores, [won, not won]):
+        vframe['frame_scores'].append({'player_id':player_id,
+                                        'won':player_won,
+                                        'score':score[0],
+                                        'foul_points':score[1]})
+
+    winner_id, loser_id = players
+    if not won:
+        loser_id, winner_id = players
+
+    winner_elo = elos[winner_id]
+    loser_elo = elos[loser_id]
+
+    change = tplayer.getEloChange(tplayer.getProbability(winner_elo, loser_elo))
+
+    for player_id, elo_change, opp_elo in [(winner_id, change, loser_elo), (loser_id, -change, winner_elo)]:
+        elos[player_id] = elos[player_id] + elo_change
+        vframe['elo_jrnl'].append({'player_id':player_id,
+                                    'elo_change':elo_change,
+                                    'opp_elo':opp_elo,
+                                    'new_elo':elos[player_id]})
+
+    match['frame_scores'].extend(vframe['frame_scores'])
+
+# Overview: Works out match scores from the frame scores (see tmatch.closeMatch)
+# Parameters: match
+def closeMatch(match):
+    players = []
+    for frame_score in match['frame_scores']:
+        if frame_score['player_id'] not in players:
+            players.append(frame_score['player_id'])
+
+    if len(players) != 2:
+        return
+
+    match_scores = []
+    for player_id in players:
+        frame_scores = [frame_score for frame_score in match['frame_scores'] if frame_score['player_id'] == player_id]
+
+        match_scores.append({'player_id':player_id,
+                                'frames_won':len([fs for fs in frame_scores if fs['won']]),
+                                'total_points':sum(fs['score'] for fs in frame_scores)})
+
+    match_scores[0]['won'] = True # player 0 wins by default
+    if match_scores[1]['frames_won'] > match_scores[0]['frames_won']:
+        match_scores[0]['won'] = False
+    elif match_scores[1]['frames_won'] == match_scores[0]['frames_won']: # Tie, go by aggregate points
+        if match_scores[1]['total_points'] > match_scores[0]['total_points']:
+            match_scores[0]['won'] = False
+
+    match_scores[1]['won'] = not match_scores[0]['won']
+
+    match['match_scores'] = match_scores
+
+# Overview: Maps csv shot type onto tball.foul
+def getFoul(shot_type):
+    if shot_type == 'Foul':
+        return 'Y'
+    return 'N'
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+schema.py: Creates and upgrades the database schema from the scripts in sql/, and checks that the queries in the
+models are covered by indexes.
+
+Each script is numbered (sql/NNN_name.sql) and the number of the last one applied is kept in PRAGMA user_version.
+Scripts only use CREATE ... IF NOT EXISTS, so databases that had them applied by hand upgrade cleanly.
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+import os
+import re
+import glob
+
+from config import db
+
+from app.utils import log
+
+sql_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sql')
+
+
+# Overview: Lists the migration scripts in order
+# Returns: [] of (version, filename)
+def getMigrations():
+    migrations = []
+    for filename in glob.glob(os.path.join(sql_dir, '*.sql')):
+        version = re.match('([0-9]+)_', os.path.basename(filename))
+        if version:
+            migrations.append((int(version.group(1)), filename))
+
+    return sorted(migrations)
+
+# Overview: Gets the version of the last migration applied to the database
+def getVersion():
+    return list(db.query("PRAGMA user_version"))[0]['user_version']
+
+# Overview: Gets the version the database is at once every migration is applied
+def getLatestVersion():
+    migrations = getMigrations()
+    if len(migrations) == 0:
+        return 0
+
+    return migrations[-1][0]
+
+# Overview: Applies every migration newer than the database, each in its own transaction along with the new version.
+#           Must not be called inside db.transaction().
+# Parameters: target (optional - version to stop at, defaults to the latest)
+# Returns: error, [] of applied filenames
+def migrate(target=None):
+    error = ""
+    applied = []
+
+    version = getVersion()
+    connection = db._db_cursor().connection
+
+    for migration_version, filename in getMigrations():
+        # version 0 is sqlite's default, so nothing has been applied yet (not even 000_schema.sql)
+        if (version > 0 and migration_version <= version) or (target is not None and migration_version > target):
+            continue
+
+        script = open(filename).read()
+        try:
+            connection.executescript("BEGIN;\n"+script+"\nPRAGMA user_version = %d;\nCOMMIT;" % migration_version)
+        except Exception, e:
+            try:
+                connection.execute("ROLLBACK")
+            except Exception:
+                pass
+            log.error('Migration %s failed - %s', 'schema', os.path.basename(filename), e)
+            error = 'Failed to apply '+os.path.basename(filename)+': '+str(e)
+            break
+
+        log.info('Applied migration %s', 'schema', os.path.basename(filename))
+        applied.append(os.path.basename(filename))
+
+    return error, applied
+
+# Overview: Runs the read functions of the models against the database, recording every SELECT they send
+# Returns: [] of (query, params), each query once
+def traceModelQueries():
+    from app.models import tmatch, tframe, tplayer, tball, breakpot, trecord, elo
+
+    sample = list(db.query("""
+                    SELECT m.match_id, m.date, f.frame_id, b.break_id, p.player_id, p.name
+                    FROM tmatch m, tframe f, tbreak b, tplayer p
+                    WHERE f.match_id=m.match_id AND
+                        b.frame_id=f.frame_id AND
+                        p.player_id=b.player_id
+                    ORDER BY m.match_id DESC
+                    LIMIT 1
+            """))
+    if len(sample) == 0:
+        return []
+    sample = sample[0]
+
+    queries = []
+    process_query = db._process_query
+
+    def record(sql_query):
+        query, params = process_query(sql_query)
+        if query.lstrip().upper().startswith('SELECT') and query not in [q for q, p in queries]:
+            queries.append((query, params))
+        return query, params
+
+    db._process_query = record
+    try:
+        tmatch.getMatchTree(sample['match_id'])
+        tmatch.getMatchPage()
+        tmatch.getMatchPage(sample['name'])
+        tmatch.getMatchCacheTags(sample['match_id'], [sample['player_id']])
+        tframe.getFrame(sample['frame_id'])
+        tframe.getCurrentFrameScore(sample['frame_id'], sample['player_id'])
+        tframe.getAllFrameIDs(sample['date'], sample['date'])
+        breakpot.getBreak(sample['break_id'])
+        breakpot.getFrameBreaks(sample['frame_id'])
+        tplayer.getAllPlayers()
+        tplayer.getAllPlayers(sample['date'], sample['date'])
+        tplayer.getPlayerStats(sample['name'])
+        tplayer.getPlayerStats(sample['name'], sample['date'], sample['date'])
+        tball.getBallStats(sample['date'], sample['date'])
+        tball.getAllBalls()
+        trecord.getPreviousRecord('highest_break', sample['date'])
+        elo.getElosBefore(sample['date'], sample['match_id'])
+        elo.getEloFrames(sample['date'], sample['match_id'])
+    finally:
+        db._process_query = process_query
+
+    return queries
+
+# Overview: Checks the query plan of every query the models send for full table scans
+# Returns: error, [] of {'query', 'plan': [] of steps, 'scans': [] of steps that read a whole table}
+def checkQueryPlans():
+    queries = traceModelQueries()
+    if len(queries) == 0:
+        return "No matches to check queries against", []
+
+    plans = []
+    cursor = db._db_cursor()
+    for query, params in queries:
+        plan = [row[3] for row in cursor.execute("EXPLAIN QUERY PLAN "+query, params)]
+
+        # subqueries and CTEs show up as SCAN too, but they aren't tables
+        subqueries = set(step.split()[1] for step in plan if step.startswith('MATERIALIZE') or step.startswith('CO-ROUTINE'))
+        scans = [step for step in plan if step.startswith('SCAN ') and
+                    'INDEX' not in step and
+                    not step.startswith('SCAN (') and
+                    step.split()[1] not in subqueries]
+
+        plans.append({'query':' '.join(query.split()), 'plan':plan, 'scans':scans})
+
+    error = ""
+    if len([plan for plan in plans if len(plan['scans']) > 0]) > 0:
+        error = "Full table scans found"
+
+    return error, plans
@@ -37,6 +37,28 @@ def getOrCreateBall(name, points, foul):
 
     return ball_id
 
+# Overview: Creates any balls that don't exist yet and returns all of them keyed on (name, foul)
+# Parameters: [] of (name, points, foul), in the order they were first seen
+# Returns: {(name, foul): {'ball_id', 'name', 'foul', 'points'}}
+# Insert: tball
+def getOrCreateBalls(balls):
+    lookup = {}
+    for ball in db.query("""
+                    SELECT ball_id, name, foul, points FROM tball
+            """):
+        lookup[(ball['name'], ball['foul'])] = ball
+
+    created = False
+    for name, points, foul in balls:
+        if (name, foul) not in lookup:
+            getOrCreateBall(name, points, foul)
+            created = True
+
+    if created:
+        return getOrCreateBalls([])
+
+    return lookup
+
 # Overview: Returns all ball types (not including fouls)
 # Returns: [] of {'ball_id', 'name', 'points'}
 def getAllBalls():
@@ -61,24 +83,60 @@ def getBallStats(from_date="2000-01-01", to_date="9999-12-31"):
 
     num_frames = num_frames * 2 # stats per player per frame (remove multiplication if we want stats per whole frame)
 
-    for ball in getAllBalls():
-        ball_stats[ball['name']+'_total'] = list(db.query("""
-                SELECT count(*) as num_pots
+    setBallStats(ball_stats, getBallPots(from_date, to_date), num_frames)
+
+    return ball_stats
+
+# Overview: Counts how many times each ball has been potted, in one query
+# Parameters: date range, by_player (count each player's pots separately), confirmed (only count confirmed matches),
+#               player_ids (optional - only count these players)
+# Returns: {ball_id: num_pots}, or {(player_id, ball_id): num_pots} if by_player
+def getBallPots(from_date="2000-01-01", to_date="9999-12-31", by_player=False, confirmed=False, player_ids=None):
+    columns = "bp.ball_id"
+    if by_player:
+        columns = "b.player_id, bp.ball_id"
+
+    filters = ""
+    if confirmed:
+        filters += ' AND m.confirmed = "Y"'
+    if player_ids is not None:
+        if len(player_ids) == 0:
+            return {}
+        filters += " AND b.player_id IN $player_ids"
+
+    pots = {}
+    for pot in db.query("""
+                SELECT """+columns+""", count(*) as num_pots
                 FROM tbreakpot bp, tbreak b, tframe f, tmatch m
                 WHERE b.break_id=bp.break_id AND
                     f.frame_id=b.frame_id AND
                     m.match_id=f.match_id AND
                     m.date >= $from_date AND
-                    m.date <= $to_date AND
-                    ball_id=$ball_id
-            """, vars={'ball_id':ball['ball_id'],
-                        'from_date':from_date,
-                        'to_date':to_date}))[0]['num_pots']
-
-        ball_stats[ball['name']+'_avg'] = 0
-        ball_stats[ball['name']+'_avg_points'] = 0
+                    m.date <= $to_date
+                    """+filters+"""
+                GROUP BY """+columns+"""
+            """, vars={'from_date':from_date, 'to_date':to_date, 'player_ids':list(player_ids or [])}):
+        if by_player:
+            pots[(pot['player_id'], pot['ball_id'])] = pot['num_pots']
+        else:
+            pots[pot['ball_id']] = pot['num_pots']
+
+    return pots
+
+# Overview: Fills in ball totals and per frame averages
+# Parameters: stats (dictionary to fill in), pots ({ball_id: num_pots}), num_frames, balls (optional - from getAllBalls)
+# Returns: stats with {'{BALL_NAME}_total', '{BALL_NAME}_avg', '{BALL_NAME}_avg_points'} for every ball
+def setBallStats(stats, pots, num_frames, balls=None):
+    if balls is None:
+        balls = getAllBalls()
+
+    for ball in balls:
+        stats[ball['name']+'_total'] = pots.get(ball['ball_id'], 0)
+
+        stats[ball['name']+'_avg'] = 0
+        stats[ball['name']+'_avg_points'] = 0
         if num_frames > 0:
-            ball_stats[ball['name']+'_avg'] = round(float(ball_stats[ball['name']+'_total']) / num_frames, 1)
-            ball_stats[ball['name']+'_avg_points'] = round((float(ball_stats[ball['name']+'_total']) / num_frames) * ball['points'], 1)
+            stats[ball['name']+'_avg'] = round(float(stats[ball['name']+'_total']) / num_frames, 1)
+            stats[ball['name']+'_avg_points'] = round((float(stats[ball['name']+'_total']) / num_frames) * ball['points'], 1)
 
-    return ball_stats
\ No newline at end of file
+    return stats
\ No newline at end of file
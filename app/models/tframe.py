@@ -14,6 +14,8 @@ import os
 from app.utils import log
 from config import db
 from app.models import tplayer
+from app.models import trecord
+from app.models import elo
 
 
 # Overview: Creates empty frame (used during match parsing)
@@ -21,7 +23,7 @@ from app.models import tplayer
 # Returns: frame_id
 # Insert: tframe
 def createFrame(match_id, frame_num):
-    log.info('createFrame('+str(match_id)+', '+str(frame_num)+')', 'tframe')
+    log.info('createFrame(%s, %s)', 'tframe', match_id, frame_num)
 
     player_id = 0
     try:
@@ -39,7 +41,7 @@ def createFrame(match_id, frame_num):
 # Insert: tframescore
 # Update: tplayerstats
 def closeFrame(frame_id):
-    log.info('closeFrame('+str(frame_id)+') +', 'tframe')
+    log.info('closeFrame(%s) +', 'tframe', frame_id)
 
     players = list(db.query("""
                     SELECT distinct player_id
@@ -100,6 +102,17 @@ def closeFrame(frame_id):
     else:
         tplayer.updateElo(players[1]['player_id'], players[0]['player_id'], frame_id)
 
+    # Update player stats
+    changes = []
+    for player in players:
+        stats = tplayer.createPlayerStats(player['player_id'])
+        tplayer.addFrameStats(stats, frame_id, player['won'], player['score'], player['foul_points'])
+        changes.append(stats)
+
+    tplayer.updatePlayerStats(changes)
+
+    trecord.addFrameRecords(frame_id)
+
     log.info('closeFrame -', 'tframe')
 
 # Overview: Gets the frame score and foul points of a player up to and including a certain break
@@ -163,14 +176,14 @@ def getCurrentFrameScore(frame_id, player_id, break_num=9999, foul_num=None, opp
                             'break_num':break_num,
                             'foul_num':foul_num}))[0]['foul_points']
 
-    log.debug('getCurrentFrameScore(frame_id='+str(frame_id)+', player_id='+str(player_id)+', break_num='+str(break_num)+', '+str(opponent)+') : '+str(score)+' , '+str(foul_points), 'tframe')
+    log.debug('getCurrentFrameScore(frame_id=%s, player_id=%s, break_num=%s, %s) : %s , %s', 'tframe', frame_id, player_id, break_num, opponent, score, foul_points)
     return score, foul_points
 
 # Overview: Sets the probability of the result
 # Parameters: frame_id, probability (decimal)
 # Update: tframe
 def updateFrameProbability(frame_id, probability):
-    log.info('updateFrameProbability('+str(frame_id)+', '+str(probability)+')', 'tframe')
+    log.info('updateFrameProbability(%s, %s)', 'tframe', frame_id, probability)
 
     db.update('tframe',
                     where='frame_id=$frame_id',
@@ -183,7 +196,7 @@ def updateFrameProbability(frame_id, probability):
 # Returns: ?
 # Insert: tframescore
 def createFrameScore(frame_id, player_id, won, score, foul_points):
-    log.info('createFrameScore(frame_id='+str(frame_id)+', player_id='+str(player_id)+', won='+str(won)+', score='+str(score)+', foul_points='+str(foul_points)+')', 'tframe')
+    log.info('createFrameScore(frame_id=%s, player_id=%s, won=%s, score=%s, foul_points=%s)', 'tframe', frame_id, player_id, won, score, foul_points)
 
     try:
         iid = db.insert('tframescore',
@@ -201,29 +214,51 @@ def createFrameScore(frame_id, player_id, won, score, foul_points):
 # Returns: Dictionary = {'frame_id', 'match_id', 'frame_num', 'frame_scores'}
 #               frame_scores = [] of {'player_id', 'name', 'won', 'score', 'foul_points'}
 def getBasicFrameInfo(frame_id):
-    log.debug('getBasicFrameInfo('+str(frame_id)+')', 'tframe')
+    log.debug('getBasicFrameInfo(%s)', 'tframe', frame_id)
 
-    entries = list(db.query("""
-                    SELECT * FROM tframe
-                    WHERE frame_id = $frame_id
-            """, vars={'frame_id':frame_id}))
+    entries = loadFrames("f.frame_id = $frame_id", {'frame_id':frame_id})
 
-    frame_info = {}
-    if len(entries) == 1:
-        frame_info = entries[0]
-    else:
-        log.error('Bad number of frames found for frame_id='+str(frame_id), 'tframe.getBasicFrameInfo')
+    if len(entries) != 1:
+        log.error('Bad number of frames found for frame_id=%s', 'tframe.getBasicFrameInfo', frame_id)
         return {}
 
-    frame_info['frame_scores'] = list(db.query("""
-                    SELECT p.player_id, p.name, fs.won, fs.score, fs.foul_points
-                    FROM tframescore fs, tplayer p
-                    WHERE fs.frame_id = $frame_id AND
-                        fs.player_id=p.player_id
-                    ORDER BY p.player_id
-            """, vars={'frame_id':frame_id}))
-
-    return frame_info
+    return entries[0]
+
+# Overview: Returns high-level information about every frame in a match
+# Parameters: match_id
+# Returns: [] of frame info (see getBasicFrameInfo)
+def getMatchFrames(match_id):
+    return loadFrames("f.match_id = $match_id", {'match_id':match_id})
+
+# Overview: Loads frames with their frame scores, one query for the frames and one for all of their scores
+# Parameters: where (condition on tframe f), vars for the condition
+# Returns: [] of frame info (see getBasicFrameInfo), ordered by frame_id
+def loadFrames(where, where_vars):
+    frames = list(db.query("""
+                    SELECT f.* FROM tframe f
+                    WHERE """+where+"""
+                    ORDER BY f.frame_id
+            """, vars=where_vars))
+
+    if len(frames) == 0:
+        return []
+
+    frame_scores = {}
+    for frame_score in db.query("""
+                    SELECT fs.frame_id, p.player_id, p.name, fs.won, fs.score, fs.foul_points
+                    FROM tframescore fs, tplayer p, tframe f
+                    WHERE fs.frame_id=f.frame_id AND
+                        fs.player_id=p.player_id AND
+                        """+where+"""
+                    ORDER BY fs.frame_id, p.player_id
+            """, vars=where_vars):
+        frame_id = frame_score.pop('frame_id')
+        frame_scores.setdefault(frame_id, []).append(frame_score)
+
+    for frame in frames:
+        frame['frame_scores'] = frame_scores.get(frame['frame_id'], [])
+
+    return frames
 
 # Overview: Returns all information about a frame
 # Parameters: frame_id
@@ -232,7 +267,7 @@ def getBasicFrameInfo(frame_id):
 #               breaks = [] of {'break_id'}    ----- {'player_id','player_name','score', 'pots'}   
 #                                              ----- pots = [] of {'ball_id', 'name', 'foul', 'points'}
 def getFrame(frame_id):
-    log.debug('getFrame('+str(frame_id)+')', 'tframe')
+    log.debug('getFrame(%s)', 'tframe', frame_id)
 
     frame = getBasicFrameInfo(frame_id)
 
@@ -242,7 +277,7 @@ def getFrame(frame_id):
                     ORDER BY break_num, foul_num
             """, vars={'frame_id':frame_id}))
 
-    log.debug('len(frame[\'breaks\']) = '+str(len(frame['breaks'])), 'tframe')
+    log.debug('len(frame[\'breaks\']) = %s', 'tframe', len(frame['breaks']))
 
     #for vbreak in breaks:
     #    frame['breaks'].append(breakpot.getBreak(vbreak['break_id']))
@@ -267,12 +302,9 @@ def getAllFrameIDs(from_date="2000-01-01", to_date="9999-12-31"):
 
     return ids
 
-# Temporary function to backpopulate elo
+# Temporary function to backpopulate elo (replays from scratch, so it can be run more than once)
 def updateMissedElos():
-    frame_ids = getAllFrameIDs()
-
-    for frame_id in frame_ids:
-        updateFrameElo(frame_id)
+    elo.replayElo()
 
 # Temporary function to backpopulate elo
 def updateFrameElo(frame_id):
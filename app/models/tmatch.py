@@ -14,13 +14,19 @@ import datetime
 
 import csv
 import StringIO
+import hashlib
+
+import config
 
 from config import db
 
 from app.utils import log
+from app.utils import cache
 from app.models import tplayer
 from app.models import tframe
 from app.models import breakpot
+from app.models import ingest
+from app.models import trecord
 
 
 # Match parsing constants
@@ -32,35 +38,73 @@ MATCH_COLUMNS = {'PLAYER':'Player',
                 'POINTS':'Points',
                 'ISLONG':'IsLong'}
 
+# Columns that make up a match fingerprint, in this order (IsLong is left out, it doesn't change the match)
+FINGERPRINT_COLUMNS = ['PLAYER', 'FRAME', 'BREAK', 'TYPE', 'BALL', 'POINTS']
+
+DUPLICATE_MATCH = "Match already imported"
+
 
 # Overview: Creates match from parsing csv
 # Parameters: csv file (csv export output from snooker app), name of file if uploaded
 # Returns: error, match_id
-# Insert: tmatch, tframe, tbreak, tbreakpot
-# Update: tplayerstats
+# Insert: tmatch, tframe, tbreak, tbreakpot, tframescore, tmatchscore, telojrnl
+# Update: tplayer
 # Delete: -
 def parseCsvMatch(csv_content, date=''):
-    func = "match.parseCsvMatch()"
+    return parseCsvMatchFile(StringIO.StringIO(csv_content), date)
+
+# Overview: Creates match from a csv file object without reading it all into memory. The file is read twice,
+#           once to validate it before anything is written, then again to stream shots into the database frame by frame.
+# Parameters: csvfile (seekable file object, e.g. an uploaded file), date
+# Returns: error, match_id (the existing match if error is DUPLICATE_MATCH)
+def parseCsvMatchFile(csvfile, date=''):
+    error, column_headers, player_names, fingerprint = checkCsvMatch(csvfile)
+    if error != "":
+        return error, 0
+
+    match_id = getMatchIdByFingerprint(fingerprint)
+    if match_id > 0:
+        log.info('Match already imported as %s', 'tmatch', match_id)
+        return DUPLICATE_MATCH, match_id
+
+    csvfile.seek(0)
+
+    return createCsvMatch(iterCsvShots(csvfile, column_headers), player_names, date, fingerprint)
+
+# Overview: First pass over a csv match, validates it and creates array of shot dictionaries. Doesn't touch the database.
+# Parameters: csv file (csv export output from snooker app)
+# Returns: error, shots ([] of {'PLAYER', 'FRAME', 'BREAK', 'TYPE', 'BALL', 'POINTS', 'ISLONG'}), player_names (in order of appearance), fingerprint
+def readCsvMatch(csv_content):
+    error, column_headers, player_names, fingerprint = checkCsvMatch(StringIO.StringIO(csv_content))
+    if error != "":
+        return error, [], [], ''
+
+    return error, list(iterCsvShots(StringIO.StringIO(csv_content), column_headers)), player_names, fingerprint
+
+# Overview: Validates a csv match (column count, headers, two players) without keeping any shots in memory,
+#           and works out its fingerprint (sha1 of the shot sequence, independent of column order)
+# Parameters: csvfile (file object)
+# Returns: error, column_headers ([] of MATCH_COLUMNS keys in file order), player_names (trimmed, in order of appearance), fingerprint
+def checkCsvMatch(csvfile):
     error = ""
 
-    data = csv.reader(StringIO.StringIO(csv_content), delimiter=',')
+    data = csv.reader(csvfile, delimiter=',')
 
     column_headers = []
 
-    player_ids = {} # dictionary of names mapping to id
+    player_names = [] # trimmed player names
 
-    shots = []
+    fingerprint = hashlib.sha1()
+    fingerprint_cols = []
 
-    # First pass to create array of shot dictionaries
     row_no = 0
     for shotrow in data:
         col_no = 0
-        shot = {}
 
         # Check number of columns
         if len(shotrow) != len(MATCH_COLUMNS):
             error = "bad number of csv columns"
-            return error, 0
+            return error, [], [], ''
 
         for colval in shotrow:
             if row_no == 0:
@@ -70,97 +114,104 @@ def parseCsvMatch(csv_content, date=''):
                     column_headers.append(column_header)
                 except StopIteration:
                     error = "invalid csv header: "+colval
-                    return error, 0
-            else:
-                # Find which column we're looking at based on headers
-                col_type = column_headers[col_no]
-
-                # Add value to shot dictionary
-                shot[col_type] = colval
-
-                # Set player names if not known, create players if they don't exist, trim spaces from player names
-                if col_type == "PLAYER":
-                    colval = colval.replace(" ", "")
-                    if colval not in player_ids:
-                        if len(player_ids) < 2:
-                            player_ids[colval] = tplayer.getOrCreatePlayer(colval)
-                        else:
-                            error = "More than two players detected"
-                            return error, 0
+                    return error, [], [], ''
+            elif column_headers[col_no] == "PLAYER":
+                # Set player names if not known, trim spaces from player names
+                colval = colval.replace(" ", "")
+                if colval not in player_names:
+                    if len(player_names) < 2:
+                        player_names.append(colval)
+                    else:
+                        error = "More than two players detected"
+                        return error, [], [], ''
 
             col_no += 1
 
-        # Add shot dictionary to list of shots
-        if shot != {}:
-            shots.append(shot)
+        if row_no == 0:
+            fingerprint_cols = [column_headers.index(col) for col in FINGERPRINT_COLUMNS]
+        else:
+            fingerprint.update("|".join(shotrow[col].replace(" ", "") for col in fingerprint_cols)+"\n")
 
         row_no += 1
 
     # Errors from first pass - Known issue: Won't work if one player doesn't pot
-    if len(player_ids) != 2:
-        error = "Invalid number of players: "+str(len(player_ids))
-        return error, 0
+    if len(player_names) != 2:
+        error = "Invalid number of players: "+str(len(player_names))
+        return error, [], [], ''
 
-    # Check if match might already exist
-    # select m.match_id, count(distinct p.name), count(*)
-    # from tmatch m, tframe f, tbreak b, tbreakpot bp, tmatchscore ms, tplayer p 
-    # where m.match_id=f.match_id and f.frame_id=b.frame_id and b.break_id=bp.break_id and 
-    #           m.match_id=ms.match_id and ms.player_id=p.player_id and p.name in ("David", "Jimmy")
-    #  group by 1 having count(distinct p.name)=2;
+    return error, column_headers, player_names, fingerprint.hexdigest()
 
-    # Second pass to populate database
-    # FIXME BEGIN TRANSACTION
-    match_id = 0
-    t = db.transaction()
-    try:
-        match_id = createMatch(date)
-        cur_player_id = 0
-        cur_frame_id = 0
-        cur_frame = 0
-        cur_break_id = 0
-        cur_break = 0
-
-        for shot in shots:
-            cur_player_id = player_ids[shot['PLAYER']]
-
-            if shot['FRAME'] != cur_frame: # New frame
-                if cur_break_id > 0:
-                    breakpot.closeBreak(cur_break_id)
-                    cur_break_id = 0
-                if cur_frame_id > 0:
-                    tframe.closeFrame(cur_frame_id)
-                cur_frame = shot['FRAME']
-                cur_frame_id = tframe.createFrame(match_id, cur_frame)
-
-
-            if shot['BREAK'] != cur_break or shot['BREAK'] == '': # New break
-                if cur_break_id > 0:
-                    breakpot.closeBreak(cur_break_id)
-                if shot['BREAK'] != '':
-                    cur_break = shot['BREAK']
-                cur_break_id = breakpot.createBreak(cur_frame_id, cur_break, cur_player_id)
-
-            # Register shot
-            breakpot.pot(cur_break_id, shot['BALL'], shot['POINTS'], shot['TYPE'])
-
-        if cur_break_id > 0:
-            breakpot.closeBreak(cur_break_id)
-
-        if cur_frame_id > 0:
-            tframe.closeFrame(cur_frame_id)
-
-        closeMatch(match_id)
-        commitMatch(match_id)
-    except Exception, e:
-        log.error('Failed to create match - '+str(e))
-        error = 'Failed to create match'
-        log.error('rollback()')
-        t.rollback()
-    else:
-        t.commit()
+# Overview: Reads shot dictionaries one at a time from a csv match that has passed checkCsvMatch
+# Parameters: csvfile (file object, at the start), column_headers (from checkCsvMatch)
+# Returns: generator of {'PLAYER', 'FRAME', 'BREAK', 'TYPE', 'BALL', 'POINTS', 'ISLONG'}
+def iterCsvShots(csvfile, column_headers):
+    data = csv.reader(csvfile, delimiter=',')
+
+    data.next() # skip headers
+
+    for shotrow in data:
+        yield dict(zip(column_headers, shotrow))
+
+# Overview: Second pass, creates players if they don't exist and populates the database from shots.
+#           Runs in its own transaction.
+# Parameters: shots (list or generator of shot dictionaries, consumed once), player_names, date, fingerprint (from checkCsvMatch)
+# Returns: error, match_id (the existing match if error is DUPLICATE_MATCH)
+def createCsvMatch(shots, player_names, date='', fingerprint=''):
+    error = ""
+
+    # uploads go through the writer connection one at a time, so page views aren't held up
+    with db.writing():
+        match_id = 0
+        t = db.transaction()
+        try:
+            player_ids = {} # dictionary of names mapping to id
+            for name in player_names:
+                player_ids[name] = tplayer.getOrCreatePlayer(name)
+
+            match_id = createMatch(date)
+
+            # claimed before any of the work, so a second upload of the same csv since parseCsvMatchFile checked
+            # fails here (fingerprint primary key) rather than after writing the whole match
+            if fingerprint != '':
+                createMatchFingerprint(match_id, fingerprint)
+
+            # Stream the shots in, writing each frame in bulk as soon as it's closed
+            replayed = ingest.ingestMatch(match_id, shots, player_ids)
+
+            commitMatch(match_id)
+
+            cache.invalidate(getMatchCacheTags(match_id, replayed))
+        except Exception, e:
+            t.rollback()
+
+            match_id = 0
+            if fingerprint != '':
+                match_id = getMatchIdByFingerprint(fingerprint)
+
+            if match_id > 0:
+                log.info('Match already imported as %s', 'tmatch', match_id)
+                error = DUPLICATE_MATCH
+            else:
+                log.error('Failed to create match - %s', 'tmatch', e)
+                error = 'Failed to create match'
+                log.error('rollback()')
+        else:
+            t.commit()
 
     return error, match_id
 
+# Overview: Gets the match date from the name of an exported csv file (match_YYYY-MM-DD*.csv)
+# Parameters: filename
+# Returns: date string, or '' if the filename doesn't have one
+def getDateFromFilename(filename):
+    date = ''
+    if 'match' in filename:
+        dates = re.findall('([0-9]+-[0-9]+-[0-9]+)', filename)
+        if len(dates) > 0:
+            date = dates[0]
+
+    return date
+
 
 # Overview: Creates match
 # Parameters: date (defaults to now, in case user doesn't specify)
@@ -184,7 +235,7 @@ def createMatch(date=''):
 # Insert: tmatchscore
 # Update: tplayerstats
 def closeMatch(match_id):
-    log.info('closeMatch('+str(match_id)+') +', 'tmatch')
+    log.info('closeMatch(%s) +', 'tmatch', match_id)
 
     players = list(db.query("""
                     SELECT distinct fs.player_id
@@ -233,8 +284,29 @@ def closeMatch(match_id):
                         player['frames_won'],
                         player['total_points'])
 
+    # Update player stats
+    changes = []
+    for player in players:
+        stats = tplayer.createPlayerStats(player['player_id'])
+        tplayer.addMatchStats(stats, player['won'])
+        changes.append(stats)
+
+    tplayer.updatePlayerStats(changes)
+
+    trecord.addMatchRecords(match_id)
+
     log.info('closeMatch -', 'tmatch')
 
+# Overview: Checks whether a match has been verified (its frames and breaks don't change after that)
+# Parameters: match_id
+# Returns: True / False
+def isConfirmed(match_id):
+    rows = list(db.query("""
+                    SELECT confirmed FROM tmatch WHERE match_id=$match_id
+            """, vars={'match_id':match_id}))
+
+    return len(rows) == 1 and rows[0]['confirmed'] == 'Y'
+
 # Overview: Commits a match once the player has verified it
 # Update: tmatch
 def commitMatch(match_id):
@@ -252,16 +324,109 @@ def commitMatch(match_id):
     
 
 # FIXME
-# Overview: Deletes tmatch entry and all related table entries
+# Overview: Deletes tmatch entry and all related table entries. Runs in its own transaction.
 # Parameter: match_id
-# Delete: tmatch, tmatchscore, tframe, tframescore, tbreak, tbreakpot
+# Delete: tmatch, tmatchscore, tframe, tframescore, tbreak, tbreakpot, tmatchfingerprint
+# Update: tplayerstats, trecord
 def deleteMatch(match_id):
-    rowcount = db.delete('tmatch',
-                where='match_id=$match_id',
-                vars={'match_id':match_id})
+    # through the writer connection, the same as uploads
+    with db.writing():
+        t = db.transaction()
+        db.ctx.ignore_nested_transactions = True # rebuildPlayerStats and rebuildRecords are part of this one
+        try:
+            cache_tags = getMatchCacheTags(match_id)
+
+            rowcount = db.delete('tmatch',
+                        where='match_id=$match_id',
+                        vars={'match_id':match_id})
+
+            if rowcount != 1:
+                error = "Bad number of rows deleted: "
+
+            # so the same csv can be uploaded again
+            db.delete('tmatchfingerprint',
+                        where='match_id=$match_id',
+                        vars={'match_id':match_id})
+
+            # stats and records can't be taken back a match at a time (highest break etc.), so start again
+            tplayer.rebuildPlayerStats()
+            trecord.rebuildRecords()
+
+            cache.invalidate(cache_tags)
+        except:
+            t.rollback()
+            log.error('Failed to delete match %s', 'tmatch', match_id)
+            raise
+        else:
+            t.commit()
+        finally:
+            db.ctx.ignore_nested_transactions = False
+
+# Overview: Works out which cached pages show a match: the match itself, its players, the listings,
+#           and any later match (their record headlines depend on earlier matches)
+# Parameters: match_id, player_ids (optional - other players whose pages have changed, e.g. their ratings were
+#             replayed after a back-dated match)
+# Returns: [] of cache tags
+def getMatchCacheTags(match_id, player_ids=[]):
+    tags = [cache.match_tag(match_id), cache.AGGREGATE]
+
+    if len(player_ids) > 0:
+        for player in db.query("""
+                        SELECT name
+                        FROM tplayer
+                        WHERE player_id IN $player_ids
+                """, vars={'player_ids':list(player_ids)}):
+            tags.append(cache.player_tag(player['name']))
+
+    for player in db.query("""
+                    SELECT p.name
+                    FROM tmatchscore ms, tplayer p
+                    WHERE ms.match_id=$match_id AND
+                        ms.player_id=p.player_id
+            """, vars={'match_id':match_id}):
+        tags.append(cache.player_tag(player['name']))
+
+    later = list(db.query("""
+                    SELECT count(*) as later
+                    FROM tmatch m, tmatch later
+                    WHERE m.match_id=$match_id AND
+                        later.date > m.date
+            """, vars={'match_id':match_id}))[0]['later']
+
+    if later > 0:
+        tags.append(cache.RECORDS)
+
+    return tags
+
+# Overview: Records the fingerprint of an uploaded csv against its match
+# Parameters: match_id, fingerprint (from checkCsvMatch)
+# Insert: tmatchfingerprint
+def createMatchFingerprint(match_id, fingerprint):
+    db.insert('tmatchfingerprint',
+                fingerprint=fingerprint,
+                match_id=match_id)
+
+# Overview: Finds a match that was created from a csv with the same fingerprint
+# Parameters: fingerprint
+# Returns: match_id, or 0 if it hasn't been imported
+def getMatchIdByFingerprint(fingerprint):
+    entries = list(db.query("""
+                    SELECT match_id
+                    FROM tmatchfingerprint
+                    WHERE fingerprint=$fingerprint
+            """, vars={'fingerprint':fingerprint}))
 
-    if rowcount != 1:
-        error = "Bad number of rows deleted: "
+    if len(entries) == 0:
+        return 0
+
+    return entries[0]['match_id']
+
+# Overview: Returns every known fingerprint (used by the bulk importer to skip files it's already seen)
+# Returns: set of fingerprints
+def getAllFingerprints():
+    return set(row['fingerprint'] for row in db.query("""
+                    SELECT fingerprint FROM tmatchfingerprint
+            """))
 
 # Overview: Creates a player match score when closing a match
 # Parameters: frame_id, player_id, won, frames_won, total_points
@@ -283,7 +448,7 @@ def createMatchScore(match_id, player_id, won, frames_won, total_points):
 # Returns: {'match_id', 'date', 'confirmed', 'match_scores', 'headline'}
 #               match_scores: [] of {'player_id', 'name', 'won', 'frames_won', 'total_points'}
 def getBasicMatchInfo(match_id):
-    log.debug('getBasicMatchInfo('+str(match_id)+')', 'tmatch')
+    log.debug('getBasicMatchInfo(%s)', 'tmatch', match_id)
 
     match_info = list(db.query("""
                             SELECT match_id, date, strftime("%d/%m/%Y", date) as pretty_date, confirmed
@@ -316,23 +481,27 @@ def getBasicMatchInfo(match_id):
 #       frames: [] of {'frame_id', 'frame_scores'}
 #       frame_scores: [] of {'player_id', 'name', 'won', 'score', 'foul_points'}
 def getMatch(match_id):
-    log.debug('getMatch('+str(match_id)+')', 'tmatch')
+    log.debug('getMatch(%s)', 'tmatch', match_id)
     
     match_info = getBasicMatchInfo(match_id)
 
-    frames = list(db.query("""
-                    SELECT frame_id
-                    FROM tframe
-                    WHERE match_id = $match_id
-            """, vars={'match_id':match_id}))
+    match_info['frames'] = tframe.getMatchFrames(match_id)
 
-    frames_info = []
-    for frame in frames:
-        frames_info.append(tframe.getBasicFrameInfo(frame['frame_id']))
+    match_info['stats'] = createMatchStats(match_info)
 
-    match_info['frames'] = frames_info
+    return match_info
 
-    match_info['stats'] = createMatchStats(match_info)
+# Overview: Returns full match information along with every break and pot, in a fixed number of queries (used by the match page)
+# Parameters: match_id
+# Returns: see getMatch, each frame also has 'breaks': [] of breaks (see breakpot.getBreak)
+def getMatchTree(match_id):
+    log.debug('getMatchTree(%s)', 'tmatch', match_id)
+
+    match_info = getMatch(match_id)
+
+    breaks = breakpot.getMatchBreaks(match_id)
+    for frame in match_info['frames']:
+        frame['breaks'] = breaks.get(frame['frame_id'], [])
 
     return match_info
 
@@ -342,18 +511,12 @@ def getMatch(match_id):
 def createMatchStats(match_info):
     stats = []
 
-    # Set up previous stats
-    previous_best_score_in_frame = list(db.query("""
-                    SELECT IFNULL(max(fs.score), 0) as best_score
-                    FROM tframe f, tframescore fs, tmatch m
-                    WHERE m.match_id=f.match_id and f.frame_id=fs.frame_id and m.date < $date
-            """, vars={'date':match_info['date']}))[0]['best_score']
-
-    previous_most_fouls_in_frame = list(db.query("""
-                    SELECT IFNULL(max(fs.foul_points), 0) as most_foul_points
-                    FROM tframe f, tframescore fs, tmatch m
-                    WHERE m.match_id=f.match_id and f.frame_id=fs.frame_id and m.date < $date
-            """, vars={'date':match_info['date']}))[0]['most_foul_points']
+    # Set up previous stats (records standing before the match, see trecord)
+    previous_best_score_in_frame = trecord.getPreviousRecord('best_score', match_info['date'])
+    previous_most_fouls_in_frame = trecord.getPreviousRecord('most_fouls', match_info['date'])
+    previous_highest_break = trecord.getPreviousRecord('highest_break', match_info['date'])
+    previous_longest_break = trecord.getPreviousRecord('longest_break', match_info['date'])
+    previous_most_frames = trecord.getPreviousRecord('most_frames', match_info['date'])
 
     # Pass for each player
     for frame in match_info['frames']:
@@ -368,37 +531,151 @@ def createMatchStats(match_info):
                                     str(frame_score['foul_points']))
                 previous_most_fouls_in_frame = frame_score['foul_points']
 
+    # Only breaks beating a record standing before the match can make a headline
+    for vbreak in db.query("""
+                    SELECT p.name, b.score, b.length
+                    FROM tbreak b, tframe f, tplayer p
+                    WHERE f.match_id=$match_id AND
+                        b.frame_id=f.frame_id AND
+                        p.player_id=b.player_id AND
+                        b.foul_num IS NULL AND
+                        (b.score > $previous_highest OR b.length > $previous_longest)
+                    ORDER BY f.frame_id, b.break_num
+            """, vars={'match_id':match_info['match_id'], 'previous_highest':previous_highest_break,
+                        'previous_longest':previous_longest_break}):
+        if vbreak['score'] > previous_highest_break:
+            stats.append(vbreak['name']+" beat the previous highest break of "+
+                                str(previous_highest_break)+" with "+str(vbreak['score']))
+            previous_highest_break = vbreak['score']
+
+        if vbreak['length'] > previous_longest_break:
+            stats.append(vbreak['name']+" beat the previous longest break of "+
+                                str(previous_longest_break)+" pots with "+str(vbreak['length']))
+            previous_longest_break = vbreak['length']
+
+    if len(match_info['frames']) > previous_most_frames:
+        stats.append("Most frames in a match, beating the previous record of "+
+                            str(previous_most_frames)+" with "+str(len(match_info['frames'])))
 
     return stats
 
 # Overview: Returns basic information for all matches
 def getAllMatches():
-    match_ids = list(db.query("""
-                    SELECT match_id
-                    FROM tmatch
-                    ORDER BY date
-            """))
-
-    matches = []
-    for match_id in match_ids:
-        matches.append(getBasicMatchInfo(match_id['match_id']))
-
-    return matches
+    return loadMatches("1=1", {})
 
 # Overview: Returns basic information for all matches a player has played
 # Parameter: player name
 def getAllMatchesForPlayer(name):
-    match_ids = list(db.query("""
-                    SELECT distinct ms.match_id
-                    FROM tmatchscore ms, tplayer p, tmatch m
-                    WHERE ms.player_id=p.player_id AND
-                        ms.match_id=m.match_id AND
-                        UPPER(p.name)=UPPER($name)
-                    ORDER BY m.date
-            """, vars={'name':name}))
+    return loadMatches(PLAYER_MATCHES, {'name':name})
+
+# Overview: Returns one page of matches in date order, paged on (date, match_id) so every page costs the same
+# Parameters: name (optional - only this player's matches), after / before (optional - cursor from a previous page),
+#               limit (matches per page)
+# Returns: {'matches', 'earlier', 'later'}
+#       matches: [] of basic match info (see getBasicMatchInfo), oldest first
+#       earlier / later: cursors for the pages either side (pass back as before / after), None if there isn't one
+#   With no cursor the latest page is returned.
+def getMatchPage(name=None, after='', before='', limit=None):
+    if limit is None:
+        limit = config.matches_per_page
+
+    where = "1=1"
+    where_vars = {'name':name}
+    if name is not None:
+        where = PLAYER_MATCHES
+
+    after = parseMatchCursor(after)
+    before = parseMatchCursor(before)
+
+    if after is not None:
+        where += " AND (m.date > $date OR (m.date = $date AND m.match_id > $match_id))"
+        where_vars['date'], where_vars['match_id'] = after
+    elif before is not None:
+        where += " AND (m.date < $date OR (m.date = $date AND m.match_id < $match_id))"
+        where_vars['date'], where_vars['match_id'] = before
+
+    # one extra match to find out if there's another page
+    matches = loadMatches(where, where_vars, descending=(after is None), limit=limit+1)
+
+    more = len(matches) > limit
+    if after is None:
+        matches = matches[len(matches)-limit:] if more else matches
+        earlier = more
+        later = before is not None
+    else:
+        matches = matches[:limit]
+        earlier = True
+        later = more
+
+    page = {'matches':matches, 'earlier':None, 'later':None}
+    if len(matches) > 0:
+        if earlier:
+            page['earlier'] = formatMatchCursor(matches[0])
+        if later:
+            page['later'] = formatMatchCursor(matches[-1])
+
+    return page
+
+# Overview: Cursors for getMatchPage are "date,match_id"
+def formatMatchCursor(match):
+    return match['date']+','+str(match['match_id'])
+
+# Overview: Reads a cursor made by formatMatchCursor
+# Returns: (date, match_id), or None if it's empty or doesn't make sense
+def parseMatchCursor(cursor):
+    if not cursor or not re.match('^[0-9]+-[0-9]+-[0-9]+,[0-9]+$', cursor):
+        return None
+
+    date, match_id = cursor.split(',')
+    return date, int(match_id)
+
+# condition for loadMatches that only keeps a player's matches (needs 'name' in the vars)
+PLAYER_MATCHES = """m.match_id IN (SELECT ms.match_id
+                                FROM tmatchscore ms, tplayer p
+                                WHERE ms.player_id=p.player_id AND
+                                    UPPER(p.name)=UPPER($name))"""
+
+# Overview: Loads basic match info and match scores for many matches in one query
+# Parameters: where (condition on tmatch m), vars for the condition,
+#               descending / limit (which end of the date order to take limit matches from)
+# Returns: [] of basic match info (see getBasicMatchInfo), ordered by date, match_id
+def loadMatches(where, where_vars, descending=False, limit=None):
+    order = "m.date, m.match_id"
+    if descending:
+        order = "m.date DESC, m.match_id DESC"
+
+    limit_qry = ""
+    if limit is not None:
+        limit_qry = "LIMIT $limit"
+        where_vars = dict(where_vars, limit=limit)
 
     matches = []
-    for match_id in match_ids:
-        matches.append(getBasicMatchInfo(match_id['match_id']))
+    for row in db.query("""
+                    SELECT m.match_id, m.date, strftime("%d/%m/%Y", m.date) as pretty_date, m.confirmed,
+                        p.player_id, p.name, ms.won, ms.frames_won, ms.total_points
+                    FROM (SELECT m.match_id
+                            FROM tmatch m
+                            WHERE """+where+"""
+                            ORDER BY """+order+"""
+                            """+limit_qry+""") page
+                        JOIN tmatch m ON m.match_id=page.match_id
+                        LEFT JOIN tmatchscore ms ON ms.match_id=m.match_id
+                        LEFT JOIN tplayer p ON p.player_id=ms.player_id
+                    ORDER BY m.date, m.match_id, p.player_id
+            """, vars=where_vars):
+        if len(matches) == 0 or matches[-1]['match_id'] != row['match_id']:
+            matches.append(web.storage(match_id=row['match_id'],
+                                        date=row['date'],
+                                        pretty_date=row['pretty_date'],
+                                        confirmed=row['confirmed'],
+                                        match_scores=[],
+                                        headline=''))
+
+        if row['player_id'] is not None:
+            matches[-1]['match_scores'].append(web.storage(player_id=row['player_id'],
+                                                            name=row['name'],
+                                                            won=row['won'],
+                                                            frames_won=row['frames_won'],
+                                                            total_points=row['total_points']))
 
     return matches
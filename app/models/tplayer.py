@@ -13,12 +13,18 @@ import re
 import os
 
 from app.utils import log
+from app.utils import cache
 from config import db
 from app.models import tball
+from app.models import bulk
 
 # ELO CONSTANTS
 f=1000.0
 k=32.0
+start_elo=1000.0 # tplayer.elo default
+
+# tplayerstats columns that are simple running totals
+STATS_TOTALS = ['matches_played', 'wins', 'frames_played', 'frame_wins', 'points', 'foul_points']
 
 # Overview: Creates player if name doesn't exist, returns existing player_id if does
 # Parameters: player name
@@ -62,166 +68,16 @@ def getBasicPlayerInfo(player_id):
 #            '[BALLNAME]*_avg', '[BALLNAME]*_avg_points'}
 #       *: stat dicts contain {'date', 'match_id', ['frame_id' / 'break_id'], ['score' / 'length' / 'foul_points']}
 def getPlayerStats(name, from_date="2000-01-01", to_date="9999-12-31"):
+    # All-time stats are kept in tplayerstats
+    if isAllTime(from_date, to_date):
+        return getAllTimePlayerStats(name)
 
-    qry = list(db.query("""
-                SELECT p.player_id, p.name, p.elo, count(*) as matches_played
-                FROM tmatchscore ms, tmatch m, tplayer p
-                WHERE p.player_id=ms.player_id AND
-                    m.match_id=ms.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date AND
-                    UPPER(p.name)=UPPER($name)
-                GROUP BY 1,2
-            """, vars={'name':name,'from_date':from_date,'to_date':to_date}))
+    players = getPlayersStats(from_date, to_date, name).values()
     
-    if len(qry) == 0:
+    if len(players) == 0:
         return None
 
-    player = qry[0]
-
-    player['elo'] = round(player['elo'], 2)
-
-    player['wins'] = list(db.query("""
-                SELECT count(*) as wins
-                FROM tmatchscore ms, tmatch m
-                WHERE player_id=$player_id AND
-                    m.match_id=ms.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date AND
-                    ms.won=1
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]['wins']
-
-    player['losses'] = player['matches_played'] - player['wins']
-    player['percentage'] = int((float(player['wins']) / player['matches_played']) * 100)
-
-    player['frames_played'] = list(db.query("""
-                SELECT count(*) as frames_played
-                FROM tframescore fs, tframe f, tmatch m
-                WHERE fs.player_id=$player_id AND
-                    fs.frame_id=f.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]['frames_played']
-
-    player['frame_wins'] = list(db.query("""
-                SELECT count(*) as frame_wins
-                FROM tframescore fs, tframe f, tmatch m
-                WHERE fs.player_id=$player_id AND
-                    fs.frame_id=f.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date AND
-                    fs.won=1
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]['frame_wins']
-
-    player['frame_losses'] = player['frames_played'] - player['frame_wins']
-    player['frame_percentage'] = int((float(player['frame_wins']) / player['frames_played']) * 100)
-
-    player['highest_break'] = list(db.query("""
-                SELECT b.break_id, b.score, m.date, m.match_id
-                FROM tbreak b, tframe f, tmatch m
-                WHERE b.player_id=$player_id AND
-                    b.frame_id=f.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date AND
-                    b.foul_num IS NULL
-                ORDER BY b.score DESC, b.length DESC
-                LIMIT 1
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]
-
-    player['longest_break'] = list(db.query("""
-                SELECT b.break_id, b.length, m.date, m.match_id
-                FROM tbreak b, tframe f, tmatch m
-                WHERE b.player_id=$player_id AND
-                    b.frame_id=f.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date AND
-                    b.foul_num IS NULL
-                ORDER BY b.length DESC
-                LIMIT 1
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]
-
-    player['best_score'] = list(db.query("""
-                SELECT fs.frame_id, fs.score, m.date, m.match_id
-                FROM tframescore fs, tframe f, tmatch m
-                WHERE fs.player_id=$player_id AND
-                    fs.frame_id=f.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date
-                ORDER BY fs.score DESC
-                limit 1
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]
-
-    player['most_fouls'] = list(db.query("""
-                SELECT fs.frame_id, fs.foul_points, m.date, m.match_id
-                FROM tframescore fs, tframe f, tmatch m
-                WHERE fs.player_id=$player_id AND
-                    fs.frame_id=f.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date
-                ORDER BY fs.foul_points DESC
-                limit 1
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]
-
-    # ppf = points per frame
-    player['ppf'] = round(list(db.query("""
-                SELECT avg(score) as ppf
-                FROM tframescore fs, tframe f, tmatch m
-                WHERE fs.player_id=$player_id AND
-                    fs.frame_id=f.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]['ppf'], 1)
-
-    # fpf = fouls per frame
-    player['fpf'] = round(list(db.query("""
-                SELECT avg(fs.foul_points) as fpf
-                FROM tframescore fs, tframe f, tmatch m
-                WHERE fs.player_id=$player_id AND
-                    fs.frame_id=f.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date
-            """, vars={'player_id':player['player_id'],'from_date':from_date,'to_date':to_date}))[0]['fpf'], 1)
-
-    for ball in tball.getAllBalls():
-        player[ball['name']+'_total'] = list(db.query("""
-                SELECT count(*) as num_pots
-                FROM tbreakpot bp, tbreak b, tframe f, tmatch m
-                WHERE b.break_id=bp.break_id AND
-                    b.player_id=$player_id AND
-                    f.frame_id=b.frame_id AND
-                    m.match_id=f.match_id AND
-                    m.confirmed = "Y" AND
-                    m.date >= $from_date AND
-                    m.date <= $to_date AND
-                    ball_id=$ball_id
-            """, vars={'player_id':player['player_id'],
-                        'ball_id':ball['ball_id'],
-                        'from_date':from_date,
-                        'to_date':to_date}))[0]['num_pots']
-
-        player[ball['name']+'_avg'] = round(float(player[ball['name']+'_total']) / player['frames_played'], 1)
-        player[ball['name']+'_avg_points'] = round((float(player[ball['name']+'_total']) / player['frames_played']) * ball['points'], 1)
-
-    return dict(player)
-
+    return players[0]
 
 # Overview: Returns information about all players
 # Parameters: date range (optional - defaults to all time)
@@ -239,14 +95,149 @@ def getAllPlayers(from_date="2000-01-01", to_date="9999-12-31"):
                     ORDER BY count(*) DESC
             """, vars={'from_date':from_date, 'to_date':to_date}))
 
+    stats = {}
+    for player in getPlayersStats(from_date, to_date).values():
+        stats[player['name']] = player
+
     players = []
     for player_name in player_names:
-        player = getPlayerStats(player_name['name'], from_date, to_date)
-        if player is not None:
-            players.append(player)
+        if player_name['name'] in stats:
+            players.append(stats[player_name['name']])
 
     return players
 
+# Overview: Works out getPlayerStats for every player in a date range with one query per group of stats
+# Parameters: date range, name (optional - only get this player)
+# Returns: player_id -> see getPlayerStats (players without confirmed matches in the range are left out)
+def getPlayersStats(from_date="2000-01-01", to_date="9999-12-31", name=None):
+    dates = {'from_date':from_date, 'to_date':to_date, 'name':name}
+
+    player_filter = ""
+    if name is not None:
+        player_filter = "AND UPPER(p.name)=UPPER($name)"
+
+    players = {}
+    for player in db.query("""
+                SELECT p.player_id, p.name, p.elo, count(*) as matches_played, sum(ms.won=1) as wins
+                FROM tmatchscore ms, tmatch m, tplayer p
+                WHERE p.player_id=ms.player_id AND
+                    m.match_id=ms.match_id AND
+                    m.confirmed = "Y" AND
+                    m.date >= $from_date AND
+                    m.date <= $to_date
+                    """+player_filter+"""
+                GROUP BY 1,2
+            """, vars=dates):
+        player['elo'] = round(player['elo'], 2)
+
+        player['losses'] = player['matches_played'] - player['wins']
+        player['percentage'] = int((float(player['wins']) / player['matches_played']) * 100)
+
+        # stats for players without any breaks/frames stay empty, same as tplayerstats
+        player['frames_played'] = 0
+        player['frame_wins'] = 0
+        player['ppf'] = None
+        player['fpf'] = None
+        player['highest_break'] = web.storage(break_id=None, score=None, date=None, match_id=None)
+        player['longest_break'] = web.storage(break_id=None, length=None, date=None, match_id=None)
+        player['best_score'] = web.storage(frame_id=None, score=None, date=None, match_id=None)
+        player['most_fouls'] = web.storage(frame_id=None, foul_points=None, date=None, match_id=None)
+
+        players[player['player_id']] = player
+
+    if len(players) == 0:
+        return {}
+
+    for frames in db.query("""
+                SELECT fs.player_id, count(*) as frames_played, sum(fs.won=1) as frame_wins,
+                    avg(fs.score) as ppf, avg(fs.foul_points) as fpf
+                FROM tframescore fs, tframe f, tmatch m, tplayer p
+                WHERE p.player_id=fs.player_id AND
+                    fs.frame_id=f.frame_id AND
+                    m.match_id=f.match_id AND
+                    m.confirmed = "Y" AND
+                    m.date >= $from_date AND
+                    m.date <= $to_date
+                    """+player_filter+"""
+                GROUP BY 1
+            """, vars=dates):
+        player = players[frames['player_id']]
+        player['frames_played'] = frames['frames_played']
+        player['frame_wins'] = frames['frame_wins']
+        # ppf = points per frame, fpf = fouls per frame
+        player['ppf'] = round(frames['ppf'], 1)
+        player['fpf'] = round(frames['fpf'], 1)
+
+    for player in players.values():
+        player['frame_losses'] = player['frames_played'] - player['frame_wins']
+        player['frame_percentage'] = int((float(player['frame_wins']) / player['frames_played']) * 100)
+
+    # Highest (by score, then length) and longest non-foul break of each player
+    for vbreak in db.query("""
+                SELECT * FROM (
+                    SELECT b.player_id, b.break_id, b.score, b.length, m.date, m.match_id,
+                        ROW_NUMBER() OVER (PARTITION BY b.player_id ORDER BY b.score DESC, b.length DESC, b.break_id) as highest_rank,
+                        ROW_NUMBER() OVER (PARTITION BY b.player_id ORDER BY b.length DESC, b.break_id) as longest_rank
+                    FROM tbreak b, tframe f, tmatch m, tplayer p
+                    WHERE p.player_id=b.player_id AND
+                        b.frame_id=f.frame_id AND
+                        m.match_id=f.match_id AND
+                        m.confirmed = "Y" AND
+                        m.date >= $from_date AND
+                        m.date <= $to_date AND
+                        b.foul_num IS NULL
+                        """+player_filter+"""
+                )
+                WHERE highest_rank=1 OR longest_rank=1
+            """, vars=dates):
+        player = players[vbreak['player_id']]
+        if vbreak['highest_rank'] == 1:
+            player['highest_break'] = web.storage(break_id=vbreak['break_id'], score=vbreak['score'],
+                                                    date=vbreak['date'], match_id=vbreak['match_id'])
+        if vbreak['longest_rank'] == 1:
+            player['longest_break'] = web.storage(break_id=vbreak['break_id'], length=vbreak['length'],
+                                                    date=vbreak['date'], match_id=vbreak['match_id'])
+
+    # Best scoring frame and frame with the most fouls of each player
+    for frame in db.query("""
+                SELECT * FROM (
+                    SELECT fs.player_id, fs.frame_id, fs.score, fs.foul_points, m.date, m.match_id,
+                        ROW_NUMBER() OVER (PARTITION BY fs.player_id ORDER BY fs.score DESC, fs.frame_id) as score_rank,
+                        ROW_NUMBER() OVER (PARTITION BY fs.player_id ORDER BY fs.foul_points DESC, fs.frame_id) as fouls_rank
+                    FROM tframescore fs, tframe f, tmatch m, tplayer p
+                    WHERE p.player_id=fs.player_id AND
+                        fs.frame_id=f.frame_id AND
+                        m.match_id=f.match_id AND
+                        m.confirmed = "Y" AND
+                        m.date >= $from_date AND
+                        m.date <= $to_date
+                        """+player_filter+"""
+                )
+                WHERE score_rank=1 OR fouls_rank=1
+            """, vars=dates):
+        player = players[frame['player_id']]
+        if frame['score_rank'] == 1:
+            player['best_score'] = web.storage(frame_id=frame['frame_id'], score=frame['score'],
+                                                date=frame['date'], match_id=frame['match_id'])
+        if frame['fouls_rank'] == 1:
+            player['most_fouls'] = web.storage(frame_id=frame['frame_id'], foul_points=frame['foul_points'],
+                                                date=frame['date'], match_id=frame['match_id'])
+
+    player_ids = None
+    if name is not None:
+        player_ids = players.keys()
+
+    pots = {}
+    for (player_id, ball_id), num_pots in tball.getBallPots(from_date, to_date, by_player=True, confirmed=True,
+                                                            player_ids=player_ids).items():
+        pots.setdefault(player_id, {})[ball_id] = num_pots
+
+    balls = tball.getAllBalls()
+    for player in players.values():
+        tball.setBallStats(player, pots.get(player['player_id'], {}), player['frames_played'], balls)
+
+    return dict((player_id, dict(player)) for player_id, player in players.items())
+
 # Overview: Calculates elo rating changes and updates them
 # Parameters: winner ID, loser ID, frame_id
 # Update: tplayer
@@ -261,8 +252,8 @@ def updateElo(winner_id, loser_id, frame_id):
     changeElo(winner_id, change, frame_id, loser['elo'])
     changeElo(loser_id, -change, frame_id, winner['elo'])
 
-    log.info(winner['name']+' elo: '+str(winner['elo'])+' + '+str(change), 'tplayer')
-    log.info(loser['name']+' elo: '+str(loser['elo'])+' - '+str(change), 'tplayer')
+    log.info('%s elo: %s + %s', 'tplayer', winner['name'], winner['elo'], change)
+    log.info('%s elo: %s - %s', 'tplayer', loser['name'], loser['elo'], change)
 
 
 # Overview: Calculates probability of one player beating another
@@ -276,16 +267,22 @@ def getContestProbability(player_id, opp_id):
 
 
 # Overview: Calculates probability of one elo beating another
-# Parameters: elo of two players
+# Parameters: elo of two players, elo_f (optional - defaults to f)
 # Returns: Decimal probability
-def getProbability(player_elo, opp_elo):
-    return 1 / (1 + 10 ** ((opp_elo - player_elo) / f))
+def getProbability(player_elo, opp_elo, elo_f=None):
+    if elo_f is None:
+        elo_f = f
+
+    return 1 / (1 + 10 ** ((opp_elo - player_elo) / elo_f))
 
 # Overview: Calculates an elo change
-# Parameter: Decimal probability
+# Parameter: Decimal probability, elo_k (optional - defaults to k)
 # Returns: elo change
-def getEloChange(probability):
-    return (k * (1 - probability))
+def getEloChange(probability, elo_k=None):
+    if elo_k is None:
+        elo_k = k
+
+    return (elo_k * (1 - probability))
 
 # Overview: Updates a player's elo
 # Parameters: player ID, elo change, frame ID (for jrnl), opponent's elo rating (for jrnl)
@@ -307,3 +304,287 @@ def changeElo(player_id, elo_change, frame_id, opp_elo):
             """, vars={'player_id':player_id, 'frame_id':frame_id, 'elo_change':elo_change, 'opp_elo':opp_elo})
     except sqlite3.IntegrityError, e:
         log.error('SQL error while inserting entry into tEloJrnl')
+
+
+# PLAYER STATS (tplayerstats / tplayerballstats, all-time stats for confirmed matches)
+
+# Overview: Works out whether a date range covers every confirmed match
+# Parameters: date range
+# Returns: True if stats for the range are the same as all-time stats
+def isAllTime(from_date, to_date):
+    if from_date == "2000-01-01" and to_date == "9999-12-31":
+        return True
+
+    dates = list(db.query("""
+                SELECT min(date) as first_date, max(date) as last_date
+                FROM tmatch
+                WHERE confirmed = "Y"
+            """))[0]
+
+    if dates['first_date'] is None:
+        return True
+
+    return str(from_date) <= dates['first_date'] and str(to_date) >= dates['last_date']
+
+# Overview: Returns all-time stats for a player from tplayerstats, same as getPlayerStats
+# Parameter: name
+# Returns: see getPlayerStats
+def getAllTimePlayerStats(name):
+    qry = list(db.query("""
+                SELECT p.player_id, p.name, p.elo, ps.*,
+                    hbm.date as highest_break_date, hbm.match_id as highest_break_match_id,
+                    lbm.date as longest_break_date, lbm.match_id as longest_break_match_id,
+                    bsm.date as best_score_date, bsm.match_id as best_score_match_id,
+                    mfm.date as most_fouls_date, mfm.match_id as most_fouls_match_id
+                FROM tplayer p
+                    JOIN tplayerstats ps ON ps.player_id=p.player_id
+                    LEFT JOIN tbreak hb ON hb.break_id=ps.highest_break_id
+                    LEFT JOIN tframe hbf ON hbf.frame_id=hb.frame_id
+                    LEFT JOIN tmatch hbm ON hbm.match_id=hbf.match_id
+                    LEFT JOIN tbreak lb ON lb.break_id=ps.longest_break_id
+                    LEFT JOIN tframe lbf ON lbf.frame_id=lb.frame_id
+                    LEFT JOIN tmatch lbm ON lbm.match_id=lbf.match_id
+                    LEFT JOIN tframe bsf ON bsf.frame_id=ps.best_score_frame_id
+                    LEFT JOIN tmatch bsm ON bsm.match_id=bsf.match_id
+                    LEFT JOIN tframe mff ON mff.frame_id=ps.most_fouls_frame_id
+                    LEFT JOIN tmatch mfm ON mfm.match_id=mff.match_id
+                WHERE UPPER(p.name)=UPPER($name)
+            """, vars={'name':name}))
+
+    if len(qry) == 0 or qry[0]['matches_played'] == 0:
+        return None
+
+    stats = qry[0]
+
+    player = {'player_id':stats['player_id'],
+                'name':stats['name'],
+                'elo':round(stats['elo'], 2),
+                'matches_played':stats['matches_played'],
+                'wins':stats['wins'],
+                'frames_played':stats['frames_played'],
+                'frame_wins':stats['frame_wins']}
+
+    player['losses'] = player['matches_played'] - player['wins']
+    player['percentage'] = int((float(player['wins']) / player['matches_played']) * 100)
+
+    player['frame_losses'] = player['frames_played'] - player['frame_wins']
+    player['frame_percentage'] = int((float(player['frame_wins']) / player['frames_played']) * 100)
+
+    player['highest_break'] = web.storage(break_id=stats['highest_break_id'], score=stats['highest_break_score'],
+                                date=stats['highest_break_date'], match_id=stats['highest_break_match_id'])
+    player['longest_break'] = web.storage(break_id=stats['longest_break_id'], length=stats['longest_break_length'],
+                                date=stats['longest_break_date'], match_id=stats['longest_break_match_id'])
+    player['best_score'] = web.storage(frame_id=stats['best_score_frame_id'], score=stats['best_score'],
+                                date=stats['best_score_date'], match_id=stats['best_score_match_id'])
+    player['most_fouls'] = web.storage(frame_id=stats['most_fouls_frame_id'], foul_points=stats['most_fouls'],
+                                date=stats['most_fouls_date'], match_id=stats['most_fouls_match_id'])
+
+    # ppf = points per frame, fpf = fouls per frame
+    player['ppf'] = round(float(stats['points']) / player['frames_played'], 1)
+    player['fpf'] = round(float(stats['foul_points']) / player['frames_played'], 1)
+
+    pots = {}
+    for row in db.query("""
+                SELECT ball_id, pots
+                FROM tplayerballstats
+                WHERE player_id=$player_id
+            """, vars={'player_id':player['player_id']}):
+        pots[row['ball_id']] = row['pots']
+
+    return tball.setBallStats(player, pots, player['frames_played'])
+
+# Overview: Returns an empty set of player stats, changes are collected in it and then applied with updatePlayerStats
+# Parameter: player_id
+# Returns: {'player_id', STATS_TOTALS, 'highest_break_id', 'highest_break_score', 'highest_break_length',
+#           'longest_break_id', 'longest_break_length', 'best_score_frame_id', 'best_score',
+#           'most_fouls_frame_id', 'most_fouls', 'balls':{ball_id: pots}}
+def createPlayerStats(player_id):
+    stats = {'player_id':player_id,
+                'highest_break_id':None, 'highest_break_score':None, 'highest_break_length':None,
+                'longest_break_id':None, 'longest_break_length':None,
+                'best_score_frame_id':None, 'best_score':None,
+                'most_fouls_frame_id':None, 'most_fouls':None,
+                'balls':{}}
+
+    for total in STATS_TOTALS:
+        stats[total] = 0
+
+    return stats
+
+# Overview: Adds a closed break to a set of player stats
+# Parameters: stats, break_id, score, length, foul (True if it's a foul break), ball_ids ([] of ball_id potted)
+def addBreakStats(stats, break_id, score, length, foul, ball_ids):
+    for ball_id in ball_ids:
+        stats['balls'][ball_id] = stats['balls'].get(ball_id, 0) + 1
+
+    if not foul:
+        setHighestBreak(stats, break_id, score, length)
+        setLongestBreak(stats, break_id, length)
+
+# Overview: Adds a closed frame to a set of player stats
+# Parameters: stats, frame_id, won, score, foul_points
+def addFrameStats(stats, frame_id, won, score, foul_points):
+    stats['frames_played'] += 1
+    if won:
+        stats['frame_wins'] += 1
+    stats['points'] += score
+    stats['foul_points'] += foul_points
+
+    if stats['best_score_frame_id'] is None or score > stats['best_score']:
+        stats['best_score_frame_id'] = frame_id
+        stats['best_score'] = score
+
+    if stats['most_fouls_frame_id'] is None or foul_points > stats['most_fouls']:
+        stats['most_fouls_frame_id'] = frame_id
+        stats['most_fouls'] = foul_points
+
+# Overview: Adds a closed match to a set of player stats
+# Parameters: stats, won
+def addMatchStats(stats, won):
+    stats['matches_played'] += 1
+    if won:
+        stats['wins'] += 1
+
+# Overview: Keeps the highest break (by score then length) in a set of player stats
+def setHighestBreak(stats, break_id, score, length):
+    if stats['highest_break_id'] is None or (score, length) > (stats['highest_break_score'], stats['highest_break_length']):
+        stats['highest_break_id'] = break_id
+        stats['highest_break_score'] = score
+        stats['highest_break_length'] = length
+
+# Overview: Keeps the longest break in a set of player stats
+def setLongestBreak(stats, break_id, length):
+    if stats['longest_break_id'] is None or length > stats['longest_break_length']:
+        stats['longest_break_id'] = break_id
+        stats['longest_break_length'] = length
+
+# Overview: Applies changes collected with createPlayerStats/add*Stats to tplayerstats
+# Parameters: [] of stats
+# Insert/Update: tplayerstats, tplayerballstats
+def updatePlayerStats(changes):
+    rows = []
+    ball_rows = []
+
+    for change in changes:
+        stats = getPlayerStatsRow(change['player_id'])
+
+        for total in STATS_TOTALS:
+            stats[total] += change[total]
+
+        if change['highest_break_id'] is not None:
+            setHighestBreak(stats, change['highest_break_id'], change['highest_break_score'], change['highest_break_length'])
+        if change['longest_break_id'] is not None:
+            setLongestBreak(stats, change['longest_break_id'], change['longest_break_length'])
+        if change['best_score_frame_id'] is not None and (stats['best_score_frame_id'] is None or change['best_score'] > stats['best_score']):
+            stats['best_score_frame_id'] = change['best_score_frame_id']
+            stats['best_score'] = change['best_score']
+        if change['most_fouls_frame_id'] is not None and (stats['most_fouls_frame_id'] is None or change['most_fouls'] > stats['most_fouls']):
+            stats['most_fouls_frame_id'] = change['most_fouls_frame_id']
+            stats['most_fouls'] = change['most_fouls']
+
+        for ball_id, pots in change['balls'].items():
+            ball_rows.append({'player_id':stats['player_id'], 'ball_id':ball_id, 'pots':stats['balls'].get(ball_id, 0) + pots})
+
+        del stats['balls']
+        rows.append(stats)
+
+    bulk.insert('tplayerstats', rows, replace=True)
+    bulk.insert('tplayerballstats', ball_rows, replace=True)
+
+# Overview: Returns a player's row from tplayerstats (or an empty one if there isn't one yet)
+# Parameter: player_id
+# Returns: see createPlayerStats
+def getPlayerStatsRow(player_id):
+    stats = createPlayerStats(player_id)
+
+    for row in db.query("""
+                SELECT * FROM tplayerstats WHERE player_id=$player_id
+            """, vars={'player_id':player_id}):
+        stats.update(row)
+
+    for row in db.query("""
+                SELECT ball_id, pots FROM tplayerballstats WHERE player_id=$player_id
+            """, vars={'player_id':player_id}):
+        stats['balls'][row['ball_id']] = row['pots']
+
+    return stats
+
+# Overview: Recreates tplayerstats and tplayerballstats from scratch for every player (e.g. after deleting a match)
+# Returns: number of players
+# Delete/Insert: tplayerstats, tplayerballstats
+def rebuildPlayerStats():
+    t = db.transaction()
+    try:
+        db.query("DELETE FROM tplayerstats")
+        db.query("DELETE FROM tplayerballstats")
+
+        db.query("""
+                INSERT INTO tplayerstats (player_id, matches_played, wins, frames_played, frame_wins, points, foul_points)
+                SELECT p.player_id,
+                    (SELECT count(*) FROM tmatchscore ms, tmatch m
+                        WHERE ms.player_id=p.player_id AND m.match_id=ms.match_id AND m.confirmed = "Y"),
+                    (SELECT count(*) FROM tmatchscore ms, tmatch m
+                        WHERE ms.player_id=p.player_id AND m.match_id=ms.match_id AND m.confirmed = "Y" AND ms.won=1),
+                    (SELECT count(*) FROM tframescore fs, tframe f, tmatch m
+                        WHERE fs.player_id=p.player_id AND fs.frame_id=f.frame_id AND m.match_id=f.match_id AND m.confirmed = "Y"),
+                    (SELECT count(*) FROM tframescore fs, tframe f, tmatch m
+                        WHERE fs.player_id=p.player_id AND fs.frame_id=f.frame_id AND m.match_id=f.match_id AND m.confirmed = "Y" AND fs.won=1),
+                    (SELECT IFNULL(sum(fs.score), 0) FROM tframescore fs, tframe f, tmatch m
+                        WHERE fs.player_id=p.player_id AND fs.frame_id=f.frame_id AND m.match_id=f.match_id AND m.confirmed = "Y"),
+                    (SELECT IFNULL(sum(fs.foul_points), 0) FROM tframescore fs, tframe f, tmatch m
+                        WHERE fs.player_id=p.player_id AND fs.frame_id=f.frame_id AND m.match_id=f.match_id AND m.confirmed = "Y")
+                FROM tplayer p
+            """)
+
+        db.query("""
+                UPDATE tplayerstats SET
+                    highest_break_id = (SELECT b.break_id FROM tbreak b, tframe f, tmatch m
+                        WHERE b.player_id=tplayerstats.player_id AND b.frame_id=f.frame_id AND m.match_id=f.match_id AND
+                            m.confirmed = "Y" AND b.foul_num IS NULL
+                        ORDER BY b.score DESC, b.length DESC, b.break_id LIMIT 1),
+                    longest_break_id = (SELECT b.break_id FROM tbreak b, tframe f, tmatch m
+                        WHERE b.player_id=tplayerstats.player_id AND b.frame_id=f.frame_id AND m.match_id=f.match_id AND
+                            m.confirmed = "Y" AND b.foul_num IS NULL
+                        ORDER BY b.length DESC, b.break_id LIMIT 1),
+                    best_score_frame_id = (SELECT fs.frame_id FROM tframescore fs, tframe f, tmatch m
+                        WHERE fs.player_id=tplayerstats.player_id AND fs.frame_id=f.frame_id AND m.match_id=f.match_id AND
+                            m.confirmed = "Y"
+                        ORDER BY fs.score DESC, fs.frame_id LIMIT 1),
+                    most_fouls_frame_id = (SELECT fs.frame_id FROM tframescore fs, tframe f, tmatch m
+                        WHERE fs.player_id=tplayerstats.player_id AND fs.frame_id=f.frame_id AND m.match_id=f.match_id AND
+                            m.confirmed = "Y"
+                        ORDER BY fs.foul_points DESC, fs.frame_id LIMIT 1)
+            """)
+
+        db.query("""
+                UPDATE tplayerstats SET
+                    highest_break_score = (SELECT score FROM tbreak WHERE break_id=tplayerstats.highest_break_id),
+                    highest_break_length = (SELECT length FROM tbreak WHERE break_id=tplayerstats.highest_break_id),
+                    longest_break_length = (SELECT length FROM tbreak WHERE break_id=tplayerstats.longest_break_id),
+                    best_score = (SELECT score FROM tframescore
+                        WHERE frame_id=tplayerstats.best_score_frame_id AND player_id=tplayerstats.player_id),
+                    most_fouls = (SELECT foul_points FROM tframescore
+                        WHERE frame_id=tplayerstats.most_fouls_frame_id AND player_id=tplayerstats.player_id)
+            """)
+
+        db.query("""
+                INSERT INTO tplayerballstats (player_id, ball_id, pots)
+                SELECT b.player_id, bp.ball_id, count(*)
+                FROM tbreakpot bp, tbreak b, tframe f, tmatch m
+                WHERE b.break_id=bp.break_id AND
+                    f.frame_id=b.frame_id AND
+                    m.match_id=f.match_id AND
+                    m.confirmed = "Y"
+                GROUP BY 1, 2
+            """)
+
+        cache.invalidate([cache.AGGREGATE] + [cache.player_tag(player['name']) for player in db.query("SELECT name FROM tplayer")])
+
+        players = list(db.query("SELECT count(*) as players FROM tplayerstats"))[0]['players']
+    except:
+        t.rollback()
+        raise
+    else:
+        t.commit()
+
+    return players
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+trecord.py: Model for database interactions related to trecord (the progression of each record over time).
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+from config import db
+
+from app.utils import log
+from app.utils import cache
+from app.models import bulk
+
+# Each entry in trecord beat every entry dated on or before it, so the record standing at any date is the
+# latest entry before it (one lookup on the record_type, date, value index).
+#   best_score: most points scored by a player in a frame (frame_id, player_id)
+#   most_fouls: most foul points given away by a player in a frame (frame_id, player_id)
+#   highest_break: highest non-foul break (break_id, player_id)
+#   longest_break: most pots in a non-foul break (break_id, player_id)
+#   most_frames: most frames in a match
+RECORD_TYPES = ['best_score', 'most_fouls', 'highest_break', 'longest_break', 'most_frames']
+
+# Overview: Returns the record that stood before a date (matches on the date itself don't count)
+# Parameters: record_type, date
+# Returns: record value, 0 if there wasn't one
+def getPreviousRecord(record_type, date):
+    return getRecord(record_type, date, "<")
+
+# Overview: Returns the record standing at the end of a date
+def getRecord(record_type, date, comparison="<="):
+    entries = list(db.query("""
+                    SELECT value
+                    FROM trecord
+                    WHERE record_type=$record_type AND
+                        date """+comparison+""" $date
+                    ORDER BY date DESC, value DESC
+                    LIMIT 1
+            """, vars={'record_type':record_type, 'date':date}))
+
+    if len(entries) == 0:
+        return 0
+
+    return entries[0]['value']
+
+# Overview: Creates a record candidate (see addRecords)
+# Returns: {'record_type', 'date', 'value', 'player_id', 'match_id', 'frame_id', 'break_id'}
+def createRecord(record_type, date, value, match_id, player_id=None, frame_id=None, break_id=None):
+    return {'record_type':record_type,
+            'date':date,
+            'value':value,
+            'player_id':player_id,
+            'match_id':match_id,
+            'frame_id':frame_id,
+            'break_id':break_id}
+
+# Overview: Adds the best candidate of each record type (the first one if they tie) if it beats the record
+#           standing at its date. Later entries it beats aren't records any more, so they're removed.
+# Parameters: [] of candidates from createRecord, in the order they happened
+# Returns: number of new records
+# Insert/Delete: trecord
+def addRecords(candidates):
+    added = 0
+    for record in bestRecords(candidates):
+        if record['value'] <= getRecord(record['record_type'], record['date']):
+            continue
+
+        bulk.insert('trecord', [record])
+
+        db.query("""
+                DELETE FROM trecord
+                WHERE record_type=$record_type AND
+                    date > $date AND
+                    value <= $value
+            """, vars=record)
+
+        added += 1
+
+    return added
+
+# Overview: Keeps the best candidate of each record type, the first one if they tie
+def bestRecords(candidates):
+    best = {}
+    for record in candidates:
+        if record['record_type'] not in best or record['value'] > best[record['record_type']]['value']:
+            best[record['record_type']] = record
+
+    return [best[record_type] for record_type in RECORD_TYPES if record_type in best]
+
+# Overview: Returns the record candidates of a closed frame
+# Parameters: date, match_id, frame_id, frame_scores ([] of {'player_id', 'score', 'foul_points'}),
+#               breaks ([] of {'break_id', 'player_id', 'score', 'length', 'foul_num'}, in break order)
+# Returns: [] of candidates (see createRecord)
+def getFrameRecords(date, match_id, frame_id, frame_scores, breaks):
+    records = []
+    for frame_score in frame_scores:
+        records.append(createRecord('best_score', date, frame_score['score'], match_id, frame_score['player_id'], frame_id))
+        records.append(createRecord('most_fouls', date, frame_score['foul_points'], match_id, frame_score['player_id'], frame_id))
+
+    for vbreak in breaks:
+        if vbreak['foul_num'] is None:
+            records.append(createRecord('highest_break', date, vbreak['score'], match_id, vbreak['player_id'], frame_id, vbreak['break_id']))
+            records.append(createRecord('longest_break', date, vbreak['length'], match_id, vbreak['player_id'], frame_id, vbreak['break_id']))
+
+    return records
+
+# Overview: Adds a closed frame to the records, reading it back from the database (see tframe.closeFrame)
+# Parameters: frame_id
+# Insert/Delete: trecord
+def addFrameRecords(frame_id):
+    frame = list(db.query("""
+                    SELECT f.frame_id, m.match_id, m.date
+                    FROM tframe f, tmatch m
+                    WHERE f.frame_id=$frame_id AND
+                        m.match_id=f.match_id
+            """, vars={'frame_id':frame_id}))[0]
+
+    frame_scores = list(db.query("""
+                    SELECT player_id, score, foul_points
+                    FROM tframescore
+                    WHERE frame_id=$frame_id
+                    ORDER BY player_id
+            """, vars={'frame_id':frame_id}))
+
+    breaks = list(db.query("""
+                    SELECT break_id, player_id, score, length, foul_num
+                    FROM tbreak
+                    WHERE frame_id=$frame_id
+                    ORDER BY break_num, foul_num
+            """, vars={'frame_id':frame_id}))
+
+    addRecords(getFrameRecords(frame['date'], frame['match_id'], frame_id, frame_scores, breaks))
+
+# Overview: Adds a closed match to the records (see tmatch.closeMatch)
+# Parameters: match_id
+# Insert/Delete: trecord
+def addMatchRecords(match_id):
+    match = list(db.query("""
+                    SELECT m.match_id, m.date, count(f.frame_id) as frames
+                    FROM tmatch m LEFT JOIN tframe f ON f.match_id=m.match_id
+                    WHERE m.match_id=$match_id
+                    GROUP BY 1, 2
+            """, vars={'match_id':match_id}))[0]
+
+    addRecords([createRecord('most_frames', match['date'], match['frames'], match_id)])
+
+# Overview: Recreates trecord from every match, in date order (e.g. after deleting a match)
+# Returns: number of records
+# Delete/Insert: trecord
+def rebuildRecords():
+    log.info('rebuildRecords +', 'trecord')
+
+    frames = db.query("""
+                SELECT m.date, m.match_id, f.frame_id, fs.player_id, fs.score, fs.foul_points
+                FROM tframescore fs, tframe f, tmatch m
+                WHERE fs.frame_id=f.frame_id AND
+                    m.match_id=f.match_id
+                ORDER BY m.date, m.match_id, f.frame_id, fs.player_id
+            """)
+
+    breaks = db.query("""
+                SELECT m.date, m.match_id, f.frame_id, b.break_id, b.player_id, b.score, b.length
+                FROM tbreak b, tframe f, tmatch m
+                WHERE b.frame_id=f.frame_id AND
+                    m.match_id=f.match_id AND
+                    b.foul_num IS NULL
+                ORDER BY m.date, m.match_id, f.frame_id, b.break_num, b.foul_num
+            """)
+
+    matches = db.query("""
+                SELECT m.date, m.match_id, count(*) as frames
+                FROM tframe f, tmatch m
+                WHERE m.match_id=f.match_id
+                GROUP BY 1, 2
+                ORDER BY m.date, m.match_id
+            """)
+
+    records = []
+    for row in frames:
+        records.append(createRecord('best_score', row['date'], row['score'], row['match_id'], row['player_id'], row['frame_id']))
+        records.append(createRecord('most_fouls', row['date'], row['foul_points'], row['match_id'], row['player_id'], row['frame_id']))
+    for row in breaks:
+        records.append(createRecord('highest_break', row['date'], row['score'], row['match_id'], row['player_id'], row['frame_id'], row['break_id']))
+        records.append(createRecord('longest_break', row['date'], row['length'], row['match_id'], row['player_id'], row['frame_id'], row['break_id']))
+    for row in matches:
+        records.append(createRecord('most_frames', row['date'], row['frames'], row['match_id']))
+
+    # Same as adding each frame (and then each match) as it was imported: best of each frame, then only if it beats the record
+    progression = []
+    for record_type in RECORD_TYPES:
+        candidates = [record for record in records if record['record_type'] == record_type]
+
+        record = 0
+        for candidate in bestPerUnit(candidates):
+            if candidate['value'] > record:
+                record = candidate['value']
+                progression.append(candidate)
+
+    t = db.transaction()
+    try:
+        db.query("DELETE FROM trecord")
+        bulk.insert('trecord', progression)
+
+        cache.invalidate([cache.RECORDS])
+    except:
+        t.rollback()
+        raise
+    else:
+        t.commit()
+
+    log.info('rebuildRecords - %s records', 'trecord', len(progression))
+
+    return len(progression)
+
+# Overview: Keeps the best candidate of each frame (or match, for most_frames), the first one if they tie
+def bestPerUnit(candidates):
+    best = []
+    for candidate in candidates:
+        unit = (candidate['match_id'], candidate['frame_id'])
+        if len(best) > 0 and best[-1][0] == unit:
+            if candidate['value'] > best[-1][1]['value']:
+                best[-1] = (unit, candidate)
+        else:
+            best.append((unit, candidate))
+
+    return [candidate for unit, candidate in best]
@@ -0,0 +1,315 @@
+"""
+cache.py: In-process cache of rendered pages and of expensive query results.
+
+Every page is stored with tags for the data it was built from ('match:12', 'player:david', 'aggregate'...).
+Invalidating a tag moves it to a new generation, and any page built before that generation is thrown away
+the next time it's asked for, so only the pages that depend on a changed match get rebuilt.
+
+Generations are kept in the database (tcachetag), and every write moves the tags it changes on in the same
+transaction, so a write from manage.py or another server process is seen too: each request first reads the
+latest generation (one indexed query) and catches up with the tags changed since the last one it saw.
+
+Results (e.g. the stats page for a date window) are kept for one generation. Once a request sees that the data
+has changed they're worked out again in the background, so the next visitor gets them straight away.
+
+Pages are sent with an ETag made from the page and the generation its tags were last invalidated at (so a
+match page's only changes when that match, or the records before it, do). Generations are stored, so every
+server process sends the same ETag for the same page, before and after a restart, and a cached page asked for
+with a matching If-None-Match gets a 304 after the one query that checks the generation.
+
+Pages that can't change while their tags don't (e.g. the breaks of a confirmed match) can be linked to with the
+version of their tags in the URL (?v=, see getVersion). Asked for with the current version, they're sent with
+long-lived Cache-Control headers; any write that changes them moves the version on, and so the URL.
+"""
+import hashlib
+import threading
+import collections
+
+import web
+import config
+from config import db
+
+from app.utils import compress
+
+# pages that depend on every match (listings, all players)
+AGGREGATE = 'aggregate'
+# every page (see clear())
+ALL = '*'
+# match pages show records set before the match, so a back-dated match can change later match pages
+RECORDS = 'records'
+
+_lock = threading.Lock()
+_entries = collections.OrderedDict()    # key -> (generation when rendering started, tags, [] of (header, value), body,
+                                        #         gzipped body or None until it's first asked for, immutable)
+_tags = {}                              # tag -> generation it was last invalidated at (as read from tcachetag)
+_generation = 0                         # newest generation read from tcachetag
+
+counters = {'hits':0, 'misses':0, 'stale':0, 'evictions':0, 'invalidations':0, 'not_modified':0,
+            'compressions':0, 'compressed_hits':0}
+
+# response headers kept with a cached page and sent again with it, and their values if the page didn't set them
+STORED_HEADERS = [('Content-Type', 'text/html; charset=utf-8'),
+                  ('Cache-Control', 'no-cache')] # browsers and proxies may keep pages, but must check the ETag first
+
+_results = collections.OrderedDict()    # key -> (generation, value, compute)
+_refreshing = False
+
+result_counters = {'hits':0, 'misses':0, 'refreshed':0}
+
+def match_tag(match_id):
+    return 'match:'+str(match_id)
+
+def player_tag(name):
+    return 'player:'+name.lower()
+
+# Overview: Returns a cached page, or renders and caches it
+# Parameters: key (route and parameters), build (function returning (page, [] of tags), calls immutable() if the
+#             page can't change while its tags don't), version (the ?v= the page was asked for with, see getVersion)
+# Returns: page body (raises 304 Not Modified instead if the client sent the page's ETag)
+def page(key, build, version=''):
+    sync()
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and isFresh(entry):
+            _entries[key] = _entries.pop(key) # most recently used goes to the end
+            counters['hits'] += 1
+            etag = makeETag(key, entry[1])
+            immutable = entry[5] and isCurrent(entry[1], version)
+        else:
+            if entry is not None:
+                del _entries[key]
+                counters['stale'] += 1
+            counters['misses'] += 1
+            entry = None
+        started = _generation
+
+    if entry is not None:
+        sendHeaders(entry[2], immutable)
+        offerCompressed(key, entry[3])
+        return conditional(etag, entry[3])
+
+    web.ctx.cache_immutable = False
+    result, tags = build()
+    body = str(result)
+
+    sent = dict(web.ctx.get('headers', []))
+    headers = [(header, sent.get(header, default)) for header, default in STORED_HEADERS]
+
+    with _lock:
+        etag = None
+        immutable = False
+        if getGeneration(tags) <= started: # otherwise the data changed while rendering, so this body is already out of date
+            etag = makeETag(key, tags)
+            immutable = web.ctx.cache_immutable and isCurrent(tags, version)
+
+        _entries[key] = (started, tags, headers, body, None, web.ctx.cache_immutable)
+        while len(_entries) > config.page_cache_size:
+            _entries.popitem(last=False)
+            counters['evictions'] += 1
+
+    sendHeaders(headers, immutable)
+    offerCompressed(key, body)
+    return conditional(etag, body)
+
+# Overview: Sends the headers kept with a page, with long-lived Cache-Control headers if it's immutable
+def sendHeaders(headers, immutable):
+    for header, value in headers:
+        if header == 'Cache-Control' and immutable:
+            value = 'public, max-age=%d, immutable' % config.immutable_max_age
+        web.header(header, value, unique=True)
+
+# Overview: Lets the compression middleware (app/utils/compress.py) send the gzipped copy kept with a page
+def offerCompressed(key, body):
+    web.ctx.env[compress.CACHED] = (body, lambda: compressed(key, body))
+
+# Overview: Returns the gzipped copy of a cached page, compressing it and keeping it with the entry the first time
+# Parameters: key, body (as cached under key)
+def compressed(key, body):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[3] is body and entry[4] is not None:
+            counters['compressed_hits'] += 1
+            return entry[4]
+
+    gzipped = compress.gzip(body)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[3] is body:
+            _entries[key] = entry[:4] + (gzipped,) + entry[5:] # replacing a key keeps its place in the order
+        counters['compressions'] += 1
+
+    return gzipped
+
+# Overview: Returns the generation the newest of the tags was invalidated at (call with _lock held)
+def getGeneration(tags):
+    return max([_tags.get(ALL, 0)] + [_tags.get(tag, 0) for tag in tags])
+
+# Overview: Returns the version of the data behind the tags, to put in the URL of a page built from them (?v=)
+#           so the URL changes whenever the page can
+# Parameters: [] of tags
+# Returns: version string
+def getVersion(tags):
+    with _lock:
+        return str(getGeneration(tags))
+
+# Overview: Checks a version from a URL against the tags (call with _lock held)
+def isCurrent(tags, version):
+    return version != '' and version == str(getGeneration(tags))
+
+# Overview: Returns the ETag of a page built from the tags (call with _lock held)
+# Parameters: key (as given to page()), [] of tags
+def makeETag(key, tags):
+    return '"%s-%d"' % (hashlib.md5(repr(key)).hexdigest()[:8], getGeneration(tags))
+
+# Overview: Returns the ETag for a result of the current generation (e.g. the stats page for a date window)
+# Parameters: anything else the response depends on (e.g. the dates)
+def dataETag(*parts):
+    sync()
+
+    with _lock:
+        generation = _generation
+    return '"d%d-%s"' % (generation, hashlib.md5(repr(parts)).hexdigest()[:8])
+
+# Overview: Sends the ETag, raising 304 Not Modified if the client already has it
+# Parameters: etag (None to send none), body
+# Returns: body
+def conditional(etag, body):
+    if etag is None:
+        return body
+
+    web.header('ETag', etag, unique=True)
+    if etag in [tag.strip() for tag in web.ctx.env.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        with _lock:
+            counters['not_modified'] += 1
+        raise web.notmodified()
+
+    return body
+
+# Overview: Marks the page being built by page() as one that can't change while its tags don't (e.g. the breaks
+#           of a confirmed match). Once it's built, it's sent with long-lived Cache-Control headers when it was
+#           asked for with the current version (see getVersion), and with the usual no-cache otherwise.
+def immutable():
+    web.ctx.cache_immutable = True
+
+# Overview: Checks that nothing an entry was built from has changed since (call with _lock held)
+def isFresh(entry):
+    started, tags = entry[0], entry[1]
+
+    return getGeneration(tags) <= started
+
+# Overview: Throws away every cached page built from any of the tags, in every process. Call it inside the
+#           transaction that makes the change (after the change is written), so it's only seen if that commits.
+# Parameters: [] of tags
+# Update: tcachetag
+def invalidate(tags):
+    generation = list(db.query("SELECT IFNULL(max(generation), 0) + 1 AS generation FROM tcachetag"))[0]['generation']
+
+    for tag in sorted(set(tags)):
+        db.query("INSERT OR REPLACE INTO tcachetag (tag, generation) VALUES ($tag, $generation)",
+                    vars={'tag':tag, 'generation':generation})
+
+# Overview: Throws away every cached page (e.g. after elo ratings are recalculated), same as invalidate
+def clear():
+    invalidate([ALL])
+
+# Overview: Catches up with the tags invalidated since the last call, by this or any other process, throwing
+#           away the pages built from them and working out the cached results again
+def sync():
+    global _generation, _refreshing
+
+    latest = list(db.query("SELECT IFNULL(max(generation), 0) AS generation FROM tcachetag"))[0]['generation']
+
+    with _lock:
+        seen = _generation
+    if latest <= seen:
+        return
+
+    changed = list(db.query("SELECT tag, generation FROM tcachetag WHERE generation > $seen", vars={'seen':seen}))
+
+    with _lock:
+        if _generation != seen:
+            return # another request caught up first
+
+        for row in changed:
+            _tags[row['tag']] = row['generation']
+            _generation = max(_generation, row['generation'])
+        counters['invalidations'] += 1
+
+        if _tags.get(ALL, 0) > seen:
+            _entries.clear()
+
+        if _refreshing or len(_results) == 0:
+            return
+        _refreshing = True
+
+    thread = threading.Thread(target=refreshResults, name='cache-refresh')
+    thread.daemon = True
+    thread.start()
+
+# Overview: Returns a result worked out for the current generation, or works it out and keeps it
+# Parameters: key (what and arguments), compute (function returning the result)
+# Returns: result of compute (shared between requests, don't change it)
+def result(key, compute):
+    sync()
+
+    with _lock:
+        entry = _results.get(key)
+        if entry is not None and entry[0] == _generation:
+            _results[key] = _results.pop(key)
+            result_counters['hits'] += 1
+            return entry[1]
+        result_counters['misses'] += 1
+        generation = _generation
+
+    value = compute()
+    storeResult(key, generation, value, compute)
+
+    return value
+
+# Overview: Keeps a result unless the data has moved on while it was being worked out
+def storeResult(key, generation, value, compute):
+    with _lock:
+        if generation != _generation:
+            return
+        _results[key] = (generation, value, compute)
+        _results[key] = _results.pop(key)
+        while len(_results) > config.result_cache_size:
+            _results.popitem(last=False)
+
+# Overview: Works out every stale result again, most recently used first, until they're all up to date
+def refreshResults():
+    global _refreshing
+    try:
+        while True:
+            with _lock:
+                generation = _generation
+                stale = [(key, entry[2]) for key, entry in reversed(_results.items()) if entry[0] != generation]
+                if len(stale) == 0:
+                    _refreshing = False
+                    return
+
+            for key, compute in stale:
+                storeResult(key, generation, compute(), compute)
+                result_counters['refreshed'] += 1
+    except:
+        with _lock:
+            _refreshing = False
+        raise
+
+# Overview: Returns hit/miss counters along with the number of cached pages and results
+def getStats():
+    with _lock:
+        stats = dict(counters)
+        stats['entries'] = len(_entries)
+        stats['max_entries'] = config.page_cache_size
+        stats['bytes'] = sum(len(entry[3]) for entry in _entries.values())
+        stats['compressed_bytes'] = sum(len(entry[4]) for entry in _entries.values() if entry[4] is not None)
+        stats['generation'] = _generation
+
+        for key, value in result_counters.items():
+            stats['result_'+key] = value
+        stats['result_entries'] = len(_results)
+
+    return stats
@@ -0,0 +1,186 @@
+"""
+compress.py: WSGI middleware that gzips HTML and JSON responses for clients that accept it.
+
+Responses smaller than config.gzip_min_size go out as they are. Bigger ones are compressed as they're sent,
+so a streamed response is never held in memory. Pages from app/utils/cache.py come with their own gzipped
+copy, which is compressed once and kept with the cache entry.
+
+The gzipped response gets its own ETag (the page's with -gz on the end). An If-None-Match with that ETag is
+turned back into the plain one before the app sees it.
+"""
+import zlib
+
+import config
+
+# set by cache.page: (body, function returning the gzipped body)
+CACHED = 'cuereview.gzip'
+
+COMPRESSIBLE = ['text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml']
+SUFFIX = '-gz'
+
+# Overview: Wraps a WSGI app (use as app.run(compress.middleware) or compress.middleware(app.wsgifunc()))
+# Parameters: app, min_size (bytes, smaller responses aren't compressed), level (1-9)
+# Returns: WSGI app
+def middleware(app, min_size=None, level=None):
+    if min_size is None:
+        min_size = config.gzip_min_size
+    if level is None:
+        level = config.gzip_level
+
+    def application(environ, start_response):
+        if not acceptsGzip(environ.get('HTTP_ACCEPT_ENCODING', '')):
+            # sent as it is, but caches still have to keep it apart from the gzipped copy
+            def plain(status, headers, exc_info=None):
+                if isCompressibleResponse(status, headers):
+                    headers = addVary(headers)
+                return start_response(status, headers, exc_info)
+
+            return app(environ, plain)
+
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            environ['HTTP_IF_NONE_MATCH'] = if_none_match.replace(SUFFIX+'"', '"')
+
+        response = {}
+        def capture(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+            response['exc_info'] = exc_info
+
+        body = app(environ, capture)
+
+        return respond(environ, start_response, response, body, if_none_match, min_size, level)
+
+    return application
+
+# Overview: Sends a response, compressing the body if it's worth it
+def respond(environ, start_response, response, body, if_none_match, min_size, level):
+    status, headers = response['status'], response['headers']
+    names = dict((name.lower(), value) for name, value in headers)
+
+    if status.startswith('304'):
+        # a 304 for the gzipped copy has to carry the gzipped copy's ETag
+        etag = names.get('etag')
+        if etag and if_none_match and gzipETag(etag) in if_none_match:
+            headers = addVary(setHeader(headers, 'ETag', gzipETag(etag)))
+        start_response(status, headers, response['exc_info'])
+        return body
+
+    if not isCompressibleResponse(status, headers):
+        start_response(status, headers, response['exc_info'])
+        return body
+
+    headers = addVary(headers)
+
+    return stream(environ, start_response, status, headers, body, min_size, level)
+
+# Overview: Reads the body until it's clearly worth compressing, then sends it gzipped (or as it is if it's small)
+def stream(environ, start_response, status, headers, body, min_size, level):
+    chunks = iter(body)
+    head = []
+    size = 0
+    finished = False
+    while size < min_size:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            finished = True
+            break
+        head.append(chunk)
+        size += len(chunk)
+
+    if finished and size < min_size:
+        close(body)
+        start_response(status, headers)
+        return head
+
+    cached = environ.get(CACHED)
+    if cached is not None:
+        # a cached page is in memory anyway, so read all of it and, if it is that page, send the copy kept with it
+        head.extend(chunks)
+        if ''.join(head) == cached[0]:
+            compressed = cached[1]()
+            start_response(status, compressedHeaders(headers, len(compressed)))
+            close(body)
+            return [compressed]
+
+    start_response(status, compressedHeaders(headers, None))
+    return gzipChunks(head, chunks, body, level)
+
+def gzipChunks(head, chunks, body, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # 16+: gzip header and trailer
+    try:
+        for chunk in head:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close(body)
+
+# Overview: Compresses a whole body (used for cached pages)
+def gzip(body, level=None):
+    if level is None:
+        level = config.gzip_level
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+def close(body):
+    if hasattr(body, 'close'):
+        body.close()
+
+# Overview: Checks Accept-Encoding for gzip (or *), ignoring it if it's given q=0
+def acceptsGzip(accept_encoding):
+    for coding in accept_encoding.lower().split(','):
+        params = [param.strip() for param in coding.split(';')]
+        if params[0] not in ('gzip', '*'):
+            continue
+        for param in params[1:]:
+            if param.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                break
+        else:
+            return True
+
+    return False
+
+def isCompressible(content_type):
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE)
+
+# Overview: Checks a response is one that's sent gzipped to clients that accept it (Vary: Accept-Encoding)
+def isCompressibleResponse(status, headers):
+    names = dict((name.lower(), value) for name, value in headers)
+    return status.startswith('200') and isCompressible(names.get('content-type', '')) and 'content-encoding' not in names
+
+def compressedHeaders(headers, length):
+    headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+    headers.append(('Content-Encoding', 'gzip'))
+    if length is not None:
+        headers.append(('Content-Length', str(length)))
+
+    for name, value in headers:
+        if name.lower() == 'etag':
+            headers = setHeader(headers, 'ETag', gzipETag(value))
+            break
+
+    return headers
+
+def gzipETag(etag):
+    if etag.endswith('"'):
+        return etag[:-1] + SUFFIX + '"'
+    return etag + SUFFIX
+
+def addVary(headers):
+    for name, value in headers:
+        if name.lower() == 'vary':
+            if 'accept-encoding' in value.lower():
+                return headers
+            return setHeader(headers, name, value + ', Accept-Encoding')
+
+    return headers + [('Vary', 'Accept-Encoding')]
+
+def setHeader(headers, name, value):
+    return [(header, value if header.lower() == name.lower() else current) for header, current in headers]
@@ -0,0 +1,67 @@
+"""
+database.py: SQLite connections with the settings from config.py applied to each one.
+
+web.py already keeps one connection per thread, so every serving thread reads through its own connection.
+Uploads and imports write through a separate connection (see writing()), one at a time. In WAL mode page views
+keep reading the last committed data while a match is being written instead of waiting for it.
+"""
+import threading
+import contextlib
+
+import web
+
+
+# Overview: Opens the database
+# Parameters: filename, pragmas ([] of (name, value) applied to every connection, in order),
+#             writer_pragmas (applied to the writer connection instead, defaults to pragmas)
+# Returns: SqliteDB
+def connect(filename, pragmas, writer_pragmas=None):
+    if writer_pragmas is None:
+        writer_pragmas = pragmas
+
+    return SqliteDB(pragmas, writer_pragmas, db=filename)
+
+# Overview: Applies pragmas to a new sqlite3 connection
+def configure(connection, pragmas):
+    for name, value in pragmas:
+        connection.execute("PRAGMA %s = %s" % (name, value))
+
+    return connection
+
+class SqliteDB(web.db.SqliteDB):
+    def __init__(self, pragmas, writer_pragmas, **keywords):
+        self.pragmas = pragmas
+        self.writer_pragmas = writer_pragmas
+        self.writer_lock = threading.RLock()
+        self.writer_connection = None
+
+        web.db.SqliteDB.__init__(self, **keywords)
+
+    def _connect(self, keywords):
+        return configure(web.db.SqliteDB._connect(self, keywords), self.pragmas)
+
+    # Overview: Sends every query this thread makes inside the block through the writer connection, holding it
+    #           so nothing else writes at the same time. Blocks can be nested.
+    @contextlib.contextmanager
+    def writing(self):
+        with self.writer_lock:
+            ctx = self._getctx()
+            if ctx.get('writing'):
+                yield
+                return
+
+            if len(ctx.transactions) > 0:
+                raise RuntimeError('writing() must start outside of any transaction')
+
+            if self.writer_connection is None:
+                self.writer_connection = configure(web.db.SqliteDB._connect(self, dict(self.keywords, check_same_thread=False)),
+                                                    self.writer_pragmas)
+
+            reader = ctx.db
+            ctx.db = self.writer_connection
+            ctx.writing = True
+            try:
+                yield
+            finally:
+                ctx.db = reader
+                ctx.writing = False
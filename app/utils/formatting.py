@@ -24,7 +24,18 @@ def match_url(match_id=0):
 def player_url(player_name=''):
     return config.cgi_url+"/players/"+player_name.lower()
 
+# markup built by ball_img, keyed by (ball_name, size, title)
+# there are only a handful of balls, sizes and titles (pot points), so it never gets big
+BALL_MARKUP = {}
+
 def ball_img(ball_name='red', size='30', title=''):
+    key = (ball_name, size, title)
+    markup = BALL_MARKUP.get(key)
+    if markup is None:
+        markup = BALL_MARKUP[key] = make_ball_img(ball_name, size, title)
+    return markup
+
+def make_ball_img(ball_name='red', size='30', title=''):
     #return '<img width="'+size+'" height="'+size+'" src="'+config.cgi_url+'/static/img/'+ball_name.lower()+'.jpg"></img>'
     if size is None:
         size = BALL_SIZES[ball_name.lower()]
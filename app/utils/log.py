@@ -1,15 +1,154 @@
-from config import log_file
+import os
+import sys
+import time
+import atexit
+import threading
+import Queue
 from datetime import datetime
 
-def debug(msg='', module='CueReview'):
-    log(msg, module, 'DEBUG')
+import config
 
-def error(msg='', module='CueReview'):
-    log(msg, module, 'ERROR')
+LEVELS = {'DEBUG':10, 'INFO':20, 'ERROR':40}
 
-def info(msg='', module='CueReview'):
-    log(msg, module, 'INFO')
+# lines waiting to be written, threading.Event for flush() or STOP
+_queue = Queue.Queue()
+_writer = None
+_writer_pid = None
 
-def log(msg='', module='CueReview', type='DEBUG'):
-    with open(log_file, "a") as f:
-        f.write(str(datetime.now())+" ["+type+"] - "+module+": "+msg+"\n")
\ No newline at end of file
+STOP = object()
+_writer_lock = threading.Lock()
+
+def debug(msg='', module='CueReview', *args):
+    log(msg, module, 'DEBUG', *args)
+
+def error(msg='', module='CueReview', *args):
+    log(msg, module, 'ERROR', *args)
+
+def info(msg='', module='CueReview', *args):
+    log(msg, module, 'INFO', *args)
+
+# Overview: Checks whether messages of a level are written (config.log_level)
+def isEnabled(type='DEBUG'):
+    return LEVELS.get(type, 0) >= LEVELS[config.log_level]
+
+# Overview: Queues a line for the writer thread. msg is only formatted (msg % args) if the level is enabled,
+#           so pass values as args rather than building the string at the call site.
+def log(msg='', module='CueReview', type='DEBUG', *args):
+    if not isEnabled(type):
+        return
+
+    if len(args) > 0:
+        msg = msg % args
+
+    _queue.put(str(datetime.now())+" ["+type+"] - "+module+": "+msg+"\n")
+    startWriter()
+
+# Overview: Starts the writer thread the first time something is logged (and again in a forked process)
+def startWriter():
+    global _writer, _writer_pid
+    if _writer_pid == os.getpid():
+        return
+
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            _writer = threading.Thread(target=writeLines, name='log-writer')
+            _writer.daemon = True
+            _writer.start()
+            _writer_pid = os.getpid()
+
+# Overview: Waits until every line queued so far is written to the log file
+# Parameters: timeout (seconds)
+def flush(timeout=5.0):
+    if _writer_pid != os.getpid():
+        return
+
+    done = threading.Event()
+    _queue.put(done)
+    done.wait(timeout)
+
+# Overview: Writes what's left and stops the writer thread (at exit, before the interpreter starts tearing down)
+def stop(timeout=5.0):
+    if _writer_pid != os.getpid():
+        return
+
+    _queue.put(STOP)
+    _writer.join(timeout)
+
+atexit.register(stop)
+
+# Overview: Writer thread. Keeps the log file open, flushes it every config.log_flush_interval seconds (or when
+#           asked to) and rotates it once it's bigger than config.log_max_bytes. Other processes (manage.py, other
+#           server processes) write to the same file, so after each flush it's opened again if one of them rotated it.
+def writeLines():
+    handle = None
+    last_flush = time.time()
+
+    while True:
+        try:
+            item = _queue.get(timeout=config.log_flush_interval)
+        except Queue.Empty:
+            item = None
+
+        try:
+            if handle is None:
+                handle = open(config.log_file, "a")
+
+            if isinstance(item, basestring):
+                handle.write(item)
+                if time.time() - last_flush < config.log_flush_interval:
+                    continue
+
+            handle.flush()
+            last_flush = time.time()
+
+            handle = checkFile(handle)
+        except (IOError, OSError), e:
+            # carry on without the file rather than let the queue grow
+            if isinstance(item, basestring):
+                sys.stderr.write(item)
+            handle = None
+
+        if isinstance(item, threading._Event):
+            item.set()
+        elif item is STOP:
+            if handle is not None:
+                handle.close()
+            return
+
+# Overview: Opens the log file again if it isn't the file that's open any more (another process rotated it),
+#           otherwise rotates it if it's too big
+# Returns: handle to carry on writing to
+def checkFile(handle):
+    if isRotated(handle):
+        handle.close()
+        return open(config.log_file, "a")
+
+    if os.fstat(handle.fileno()).st_size >= config.log_max_bytes:
+        return rotate(handle)
+
+    return handle
+
+# Overview: Checks whether the open log file has been moved away from config.log_file
+def isRotated(handle):
+    try:
+        path = os.stat(config.log_file)
+    except OSError:
+        return True # moved and not made again yet
+
+    current = os.fstat(handle.fileno())
+    return (path.st_dev, path.st_ino) != (current.st_dev, current.st_ino)
+
+# Overview: Moves the log file to log_file.1 (and log_file.1 to log_file.2...), keeping config.log_backups of them
+# Returns: handle of the new, empty, log file
+def rotate(handle):
+    handle.close()
+
+    if config.log_backups > 0:
+        for num in range(config.log_backups - 1, 0, -1):
+            if os.path.exists(config.log_file+"."+str(num)):
+                os.rename(config.log_file+"."+str(num), config.log_file+"."+str(num + 1))
+        os.rename(config.log_file, config.log_file+".1")
+
+        return open(config.log_file, "a")
+
+    return open(config.log_file, "w")
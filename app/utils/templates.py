@@ -0,0 +1,113 @@
+"""
+templates.py: Template rendering that compiles each template once.
+
+web.py's render either compiles a template on every call (cache off, so edits show up straight away) or
+compiles it once and never looks at the file again (cache on). This keeps the compiled template and only
+compiles it again when the file's modification time changes, so development still works without paying
+for the compile on every break of every frame.
+
+Every call is timed, see getStats().
+"""
+import os
+import time
+import threading
+
+import web
+
+
+class Render(web.template.Render):
+
+    def __init__(self, loc, **keywords):
+        web.template.Render.__init__(self, loc, cache=False, **keywords)
+        self._lock = threading.Lock()
+        self._compiled = {}     # name -> (path, mtime, timed template)
+        self._stats = {}        # name -> {'compiles', 'renders', 'seconds', 'max_seconds'}
+
+    # Overview: Returns the compiled template, compiling it if it's new or its file has changed since
+    def _template(self, name):
+        entry = self._compiled.get(name)
+        if entry is not None:
+            path, mtime, template = entry
+            try:
+                if os.path.getmtime(path) == mtime:
+                    return template
+            except OSError:
+                pass # file has gone, let the lookup below report it
+
+        kind, path = self._lookup(name)
+        if kind != 'file':
+            return self._load_template(name) # sub-directory render or AttributeError
+
+        mtime = os.path.getmtime(path)
+        template = self.timed(name, self._load_template(name))
+
+        with self._lock:
+            self._compiled[name] = (path, mtime, template)
+            self.statsFor(name)['compiles'] += 1
+
+        return template
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._template(name)
+
+    # Overview: Wraps a compiled template so each call is counted and timed
+    def timed(self, name, template):
+        def render(*args, **kwargs):
+            start = time.time()
+            try:
+                return template(*args, **kwargs)
+            finally:
+                seconds = time.time() - start
+                with self._lock:
+                    stats = self.statsFor(name)
+                    stats['renders'] += 1
+                    stats['seconds'] += seconds
+                    if seconds > stats['max_seconds']:
+                        stats['max_seconds'] = seconds
+
+        return render
+
+    # Overview: Returns the stats of a template (call with _lock held)
+    def statsFor(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {'compiles':0, 'renders':0, 'seconds':0.0, 'max_seconds':0.0}
+        return stats
+
+    # Overview: Compiles every template in the directory, so the first visitor doesn't wait for it
+    #           and syntax errors show up at startup
+    # Returns: [] of template names compiled
+    def precompile(self):
+        names = set()
+        for filename in os.listdir(self._loc):
+            name, ext = os.path.splitext(filename)
+            if ext == '.html' and not filename.endswith('~'):
+                names.add(name)
+
+        for name in sorted(names):
+            self._template(name)
+
+        return sorted(names)
+
+    # Overview: Returns compile and render counts and times of every template used so far
+    # Returns: {} of template name -> {'compiles', 'renders', 'seconds', 'max_seconds', 'mean_seconds'}
+    def getStats(self):
+        with self._lock:
+            stats = dict((name, dict(values)) for name, values in self._stats.items())
+
+        for values in stats.values():
+            values['mean_seconds'] = values['seconds'] / values['renders'] if values['renders'] else 0.0
+
+        return stats
+
+
+# Overview: Opens a template directory
+# Parameters: loc (directory), precompile (compile every template now), keywords (as web.template.render, e.g. globals)
+# Returns: Render
+def render(loc, precompile=False, **keywords):
+    view = Render(loc, **keywords)
+    if precompile:
+        view.precompile()
+    return view
@@ -9,30 +9,63 @@ import web
 
 from app.utils import functions
 from app.utils import formatting
+from app.utils import database
+from app.utils import templates
 
 name ='CueReview'
 cgi_url = ''
 version = '0.34'
 bdate = '10/06/12'
 log_file = '/home/dwilliam/projects/CueReview/logs/cuereview.log'
+log_level = 'INFO'              # DEBUG, INFO or ERROR
+log_flush_interval = 1.0        # seconds between writes to disk
+log_max_bytes = 10485760        # log_file is rotated once it's bigger than this
+log_backups = 5                 # rotated files kept (log_file.1 to log_file.5)
+
+# SQLite settings applied to every connection (see app/utils/database.py)
+db_pragmas = [('journal_mode', 'WAL'),      # readers carry on while a match is being written
+              ('synchronous', 'NORMAL'),    # safe with WAL, a power cut can only lose the last few commits
+              ('cache_size', -16000),       # KiB per connection
+              ('mmap_size', 268435456),     # bytes of the database file read through mmap
+              ('temp_store', 'MEMORY'),
+              ('busy_timeout', 5000)]       # ms to wait for another writer (e.g. manage.py) to finish
+
+# the connection uploads and imports write through
+db_writer_pragmas = db_pragmas + [('cache_size', -64000)]
 
 # connect to database
-db = web.database(dbn='sqlite',
-                  db='CueReview.sqlite')
+db = database.connect('CueReview.sqlite', db_pragmas, db_writer_pragmas)
 
 # Debug Mode
 web.config.debug = True
 web.config.db_printing = web.config.debug
 
-# Template Caching
-cache = False
+# Templates are compiled once and again whenever their file changes (see app/utils/templates.py)
+template_precompile = True      # compile them all at startup
+
+# Matches shown per page on /matches and player pages
+matches_per_page = 60
+# Most matches the API sends in one page (?limit=)
+api_max_limit = 500
+
+# Responses at least this big (bytes) are gzipped for clients that accept it (see app/utils/compress.py)
+gzip_min_size = 1024
+gzip_level = 6
+
+# How long browsers and proxies keep pages that can't change, e.g. the breaks of a confirmed match asked for with
+# the match's current version (?v=, see app/utils/cache.py) (seconds)
+immutable_max_age = 31536000
+
+# Rendered pages and stats results kept in memory (see app/utils/cache.py)
+page_cache_size = 500
+result_cache_size = 32
 
 
 # template global functions
 globals = functions.get_all_functions(formatting)
 
 # Base Template
-view = web.template.render('app/views', cache=cache, globals=globals)
+view = templates.render('app/views', precompile=template_precompile, globals=globals)
 
 
 # Error email address
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""
+manage.py: Command line tools for CueReview.
+
+    python manage.py migrate                         (create or upgrade the database schema from sql/)
+    python manage.py check-indexes [-v]              (fail if any model query scans a whole table)
+    python manage.py import ~/exports/               (every match_*.csv in a directory)
+    python manage.py import "exports/match_2013-*.csv"
+    python manage.py rebuild-stats                   (recreate tplayerstats from every confirmed match)
+    python manage.py rebuild-records                 (recreate trecord from every match)
+    python manage.py rebuild-frame-scores [frame_id...] (recalculate tbreak.frame_score and opp_frame_score)
+    python manage.py check-frame-scores [frame_id...] (replay frames through FrameScore and compare with the database)
+    python manage.py replay-elo [-f 1000] [-k 32] [--dry-run] (recalculate elo ratings from every frame in date order)
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+import sys
+import time
+import argparse
+
+import web
+import config
+
+# query printing would swamp the output of bulk jobs
+config.db.printing = False
+
+
+def rate(count, elapsed):
+    if elapsed <= 0:
+        return 0.0
+    return count / elapsed
+
+def migrate(args):
+    from app.models import schema
+
+    print "Database is at version %d" % schema.getVersion()
+
+    error, applied = schema.migrate(args.to)
+    for filename in applied:
+        print "Applied %s" % filename
+
+    if error != "":
+        print error
+        return 1
+
+    print "Database is at version %d (latest %d)" % (schema.getVersion(), schema.getLatestVersion())
+    return 0
+
+def check_indexes(args):
+    from app.models import schema
+
+    if schema.getVersion() < schema.getLatestVersion():
+        print "Database is at version %d, run migrate first (latest %d)" % (schema.getVersion(), schema.getLatestVersion())
+        return 1
+
+    error, plans = schema.checkQueryPlans()
+    for plan in plans:
+        if len(plan['scans']) > 0 or args.verbose:
+            print "%s %s" % ("SCAN" if len(plan['scans']) > 0 else "ok  ", plan['query'])
+            for step in plan['plan']:
+                print "        %s" % step
+
+    print "Checked %d queries, %d with full table scans" % (len(plans), len([plan for plan in plans if len(plan['scans']) > 0]))
+    if error != "":
+        print error
+        return 1
+
+    return 0
+
+def import_matches(args):
+    from app.models import importer
+
+    filenames = importer.findMatchFiles(args.paths)
+    if len(filenames) == 0:
+        print "No csv files found"
+        return 1
+
+    def progress(report):
+        print "%d/%d imported, %d skipped, %d rejected, %.1f matches/sec, %.0f shots/sec" % (
+                report['imported'], report['files'], len(report['skipped']), len(report['rejected']),
+                rate(report['imported'], report['elapsed']), rate(report['shots'], report['elapsed']))
+
+    report = importer.importFiles(filenames, processes=args.processes, batch_size=args.batch_size, progress=progress)
+
+    print "Imported %d matches (%d shots) in %.1fs" % (report['imported'], report['shots'], report['elapsed'])
+    if len(report['skipped']) > 0:
+        print "Skipped %d files that were already imported" % len(report['skipped'])
+    for filename, error in report['rejected']:
+        print "Rejected %s: %s" % (filename, error)
+
+    return 0
+
+def rebuild_stats(args):
+    from app.models import tplayer
+
+    start = time.time()
+    players = tplayer.rebuildPlayerStats()
+    print "Rebuilt stats for %d players in %.1fs" % (players, time.time() - start)
+
+    return 0
+
+def rebuild_records(args):
+    from app.models import trecord
+
+    start = time.time()
+    records = trecord.rebuildRecords()
+    print "Rebuilt %d records in %.1fs" % (records, time.time() - start)
+
+    return 0
+
+def rebuild_frame_scores(args):
+    from app.models import framescore
+
+    start = time.time()
+    report = framescore.rebuildFrameScores(args.frame_ids or None)
+    elapsed = time.time() - start
+    print "Rebuilt frame scores for %d frames (%d breaks, %d rows changed) in %.1fs, %.0f breaks/sec" % (
+            report['frames'], report['breaks'], report['changed'], elapsed, rate(report['breaks'], elapsed))
+
+    return 0
+
+def check_frame_scores(args):
+    from app.models import framescore
+
+    start = time.time()
+    report = framescore.checkFrameScores(args.frame_ids or None)
+    print "Checked %d frames (%d breaks) in %.1fs" % (report['frames'], report['breaks'], time.time() - start)
+    for mismatch in report['mismatches']:
+        print mismatch
+
+    if len(report['mismatches']) > 0:
+        print "%d mismatches" % len(report['mismatches'])
+        return 1
+
+    return 0
+
+def replay_elo(args):
+    from app.models import elo
+    from app.models import tplayer
+
+    players = dict((player['player_id'], player) for player in config.db.query("SELECT player_id, name, elo FROM tplayer"))
+
+    start = time.time()
+    report = elo.replayElo(args.f, args.k, dry_run=args.dry_run)
+    elapsed = time.time() - start
+
+    for player_id, rating in sorted(report['ratings'].items(), key=lambda item: -item[1]):
+        print "%-20s %8.2f (was %.2f)" % (players[player_id]['name'], rating, players[player_id]['elo'])
+
+    print "%s %d frames with f=%s, k=%s in %.1fs, %.0f frames/sec" % ("Replayed (dry run)" if args.dry_run else "Replayed",
+            report['frames'], args.f or tplayer.f, args.k or tplayer.k, elapsed, rate(report['frames'], elapsed))
+
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=config.name+' command line tools')
+    commands = parser.add_subparsers()
+
+    cmd = commands.add_parser('migrate', help='create or upgrade the database schema from the scripts in sql/')
+    cmd.add_argument('--to', type=int, default=None, help='version to stop at (default: latest)')
+    cmd.set_defaults(func=migrate)
+
+    cmd = commands.add_parser('check-indexes', help='check the query plans of the model queries for full table scans')
+    cmd.add_argument('-v', '--verbose', action='store_true', help='print every query plan')
+    cmd.set_defaults(func=check_indexes)
+
+    cmd = commands.add_parser('import', help='bulk import match csv files')
+    cmd.add_argument('paths', nargs='+', help='directories (match_*.csv inside them are imported) or glob patterns')
+    cmd.add_argument('-p', '--processes', type=int, default=None, help='parser processes (default: number of cpus)')
+    cmd.add_argument('-b', '--batch-size', type=int, default=50, help='matches written per transaction')
+    cmd.set_defaults(func=import_matches)
+
+    cmd = commands.add_parser('rebuild-stats', help='recreate all-time player stats (tplayerstats) from scratch')
+    cmd.set_defaults(func=rebuild_stats)
+
+    cmd = commands.add_parser('rebuild-records', help='recreate the record progression (trecord) from scratch')
+    cmd.set_defaults(func=rebuild_records)
+
+    cmd = commands.add_parser('rebuild-frame-scores', help='recalculate running frame scores of breaks (tbreak.frame_score, opp_frame_score)')
+    cmd.add_argument('frame_ids', nargs='*', type=int, help='frames to rebuild (default: every frame)')
+    cmd.set_defaults(func=rebuild_frame_scores)
+
+    cmd = commands.add_parser('check-frame-scores', help='check running frame scores against tframe.getCurrentFrameScore')
+    cmd.add_argument('frame_ids', nargs='*', type=int, help='frames to check (default: every frame)')
+    cmd.set_defaults(func=check_frame_scores)
+
+    cmd = commands.add_parser('replay-elo', help='recalculate elo ratings, telojrnl and result probabilities from every frame')
+    cmd.add_argument('-f', type=float, default=None, help='elo scale (default: tplayer.f)')
+    cmd.add_argument('-k', type=float, default=None, help='elo k-factor (default: tplayer.k)')
+    cmd.add_argument('-n', '--dry-run', action='store_true', help='only print the ratings, don\'t write them')
+    cmd.set_defaults(func=replay_elo)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,73 @@
+-- Core tables. Existing databases already have these, so nothing here replaces anything.
+CREATE TABLE IF NOT EXISTS tplayer (
+    player_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE,
+    elo REAL DEFAULT 1000
+);
+
+CREATE TABLE IF NOT EXISTS tmatch (
+    match_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT,
+    confirmed TEXT DEFAULT 'N'
+);
+
+CREATE TABLE IF NOT EXISTS tmatchscore (
+    match_id INTEGER,
+    player_id INTEGER,
+    won INTEGER,
+    frames_won INTEGER,
+    total_points INTEGER,
+    PRIMARY KEY (match_id, player_id)
+);
+
+CREATE TABLE IF NOT EXISTS tframe (
+    frame_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    match_id INTEGER,
+    frame_num INTEGER,
+    result_probability REAL
+);
+
+CREATE TABLE IF NOT EXISTS tframescore (
+    frame_id INTEGER,
+    player_id INTEGER,
+    won INTEGER,
+    score INTEGER,
+    foul_points INTEGER,
+    PRIMARY KEY (frame_id, player_id)
+);
+
+CREATE TABLE IF NOT EXISTS tbreak (
+    break_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    frame_id INTEGER,
+    break_num INTEGER,
+    player_id INTEGER,
+    score INTEGER,
+    foul_num INTEGER,
+    length INTEGER,
+    frame_score INTEGER,
+    opp_frame_score INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS tbreakpot (
+    break_id INTEGER,
+    pot_num INTEGER,
+    ball_id INTEGER,
+    PRIMARY KEY (break_id, pot_num)
+);
+
+CREATE TABLE IF NOT EXISTS tball (
+    ball_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    foul TEXT,
+    points INTEGER,
+    colour TEXT
+);
+
+CREATE TABLE IF NOT EXISTS telojrnl (
+    jrnl_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    player_id INTEGER,
+    frame_id INTEGER,
+    elo_change REAL,
+    opp_elo REAL,
+    new_elo REAL
+);
@@ -0,0 +1,7 @@
+-- Fingerprint of the shot sequence of every uploaded csv, so the same match can't be imported twice
+CREATE TABLE IF NOT EXISTS tmatchfingerprint (
+    fingerprint TEXT NOT NULL PRIMARY KEY,
+    match_id INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS tmatchfingerprint_match_id ON tmatchfingerprint (match_id);
@@ -0,0 +1,28 @@
+-- All-time stats for each player (confirmed matches only), kept up to date as matches are imported.
+-- Rebuild from scratch with: python manage.py rebuild-stats
+CREATE TABLE IF NOT EXISTS tplayerstats (
+    player_id INTEGER NOT NULL PRIMARY KEY,
+    matches_played INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    frames_played INTEGER NOT NULL DEFAULT 0,
+    frame_wins INTEGER NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    foul_points INTEGER NOT NULL DEFAULT 0,
+    highest_break_id INTEGER,
+    highest_break_score INTEGER,
+    highest_break_length INTEGER,
+    longest_break_id INTEGER,
+    longest_break_length INTEGER,
+    best_score_frame_id INTEGER,
+    best_score INTEGER,
+    most_fouls_frame_id INTEGER,
+    most_fouls INTEGER
+);
+
+-- Number of times each player has potted each ball (fouls included, under their own ball_id)
+CREATE TABLE IF NOT EXISTS tplayerballstats (
+    player_id INTEGER NOT NULL,
+    ball_id INTEGER NOT NULL,
+    pots INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (player_id, ball_id)
+);
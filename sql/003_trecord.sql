@@ -0,0 +1,15 @@
+-- Progression of each record (best frame score, most fouls, highest/longest break, most frames in a match).
+-- Every entry beat all entries dated on or before it. Rebuild from scratch with: python manage.py rebuild-records
+CREATE TABLE IF NOT EXISTS trecord (
+    record_id INTEGER NOT NULL PRIMARY KEY,
+    record_type TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    player_id INTEGER,
+    match_id INTEGER NOT NULL,
+    frame_id INTEGER,
+    break_id INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS trecord_type_date ON trecord (record_type, date, value);
+CREATE INDEX IF NOT EXISTS trecord_match ON trecord (match_id);
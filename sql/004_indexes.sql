@@ -0,0 +1,16 @@
+-- Indexes for the queries in the models. python manage.py check-indexes fails if any of them scans a whole table.
+CREATE INDEX IF NOT EXISTS tmatch_date ON tmatch (date, match_id);
+CREATE INDEX IF NOT EXISTS tmatch_confirmed_date ON tmatch (confirmed, date);
+CREATE INDEX IF NOT EXISTS tmatchscore_player ON tmatchscore (player_id, match_id, won);
+
+CREATE INDEX IF NOT EXISTS tframe_match ON tframe (match_id, frame_num);
+CREATE INDEX IF NOT EXISTS tframescore_player ON tframescore (player_id, frame_id);
+
+CREATE INDEX IF NOT EXISTS tbreak_frame ON tbreak (frame_id, break_num, foul_num);
+CREATE INDEX IF NOT EXISTS tbreak_player ON tbreak (player_id, frame_id);
+CREATE INDEX IF NOT EXISTS tbreakpot_ball ON tbreakpot (ball_id, break_id);
+
+CREATE INDEX IF NOT EXISTS tplayer_upper_name ON tplayer (UPPER(name));
+CREATE INDEX IF NOT EXISTS tball_foul ON tball (foul, points);
+
+CREATE INDEX IF NOT EXISTS telojrnl_frame ON telojrnl (frame_id, player_id);
@@ -0,0 +1,11 @@
+-- Generation each cache tag was last changed at (see app/utils/cache.py). Every write moves the tags it changes
+-- on in its own transaction, so every server process sees it on its next request.
+CREATE TABLE IF NOT EXISTS tcachetag (
+    tag TEXT NOT NULL PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS tcachetag_generation ON tcachetag (generation);
+
+-- Generations start at the time the table is made, so a database made again from scratch doesn't reuse old ones
+INSERT OR IGNORE INTO tcachetag (tag, generation) VALUES ('*', CAST(strftime('%s', 'now') AS INTEGER));
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+test_cache.py: Checks that an upload invalidates the cached pages of every player whose rating it changes,
+including players in later matches when a back-dated match replays their ratings (elo.replayAfter).
+
+Run from the top of the repository with: python -m unittest discover tests
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import config
+from config import db
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class BackDatedMatchTest(unittest.TestCase):
+
+    # Overview: Uploads Xena v Yann, then Yann v Zoe the day after, into a new database
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+
+        # every model shares config.db, so point it at the new database and drop any connection another test made
+        db.keywords['database'] = os.path.join(cls.dir, 'CueReview.sqlite')
+        db._ctx.clear()
+        db.writer_connection = None
+        db.printing = False
+        config.log_file = os.path.join(cls.dir, 'cuereview.log')
+
+        from app.models import schema
+
+        error, applied = schema.migrate()
+        assert error == '', error
+
+        cls.csv = open(os.path.join(fixtures, 'match_2013-01-01.csv')).read()
+
+        cls.upload({'David':'Xena', 'Jimmy':'Yann'}, '2013-01-02')
+        cls.upload({'David':'Yann', 'Jimmy':'Zoe'}, '2013-01-03')
+
+    @classmethod
+    def tearDownClass(cls):
+        from app.utils import log
+        log.flush()
+
+        shutil.rmtree(cls.dir)
+
+    # Overview: Uploads the fixture match with its players renamed
+    # Parameters: names (fixture name -> name), date
+    @classmethod
+    def upload(cls, names, date):
+        from app.models import tmatch
+
+        csv = cls.csv
+        for name in names:
+            csv = csv.replace(name+',', name.upper()+',')
+        for name in names:
+            csv = csv.replace(name.upper()+',', names[name]+',')
+
+        error, match_id = tmatch.parseCsvMatch(csv, date)
+        assert error == '', error
+
+        return match_id
+
+    # Overview: Returns a player's rating and the version of their cached pages
+    def getPlayer(self, name):
+        from app.utils import cache
+
+        cache.sync()
+        elo = db.select('tplayer', what='elo', where='name=$name', vars={'name':name})[0]['elo']
+
+        return elo, cache.getVersion([cache.player_tag(name)])
+
+    # Overview: Uploads Yann v Xena the day before both matches, which changes Yann's rating before he plays Zoe
+    def test_replayed_player_invalidated(self):
+        elo_before, version_before = self.getPlayer('Zoe')
+
+        self.upload({'David':'Yann', 'Jimmy':'Xena'}, '2013-01-01')
+
+        elo_after, version_after = self.getPlayer('Zoe')
+
+        self.assertNotEqual(elo_before, elo_after)
+        self.assertNotEqual(version_before, version_after)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+test_framescore.py: Checks the running frame scores FrameScore works out during ingest against
+tframe.getCurrentFrameScore, the SQL routine it replaced.
+
+Run from the top of the repository with: python -m unittest discover tests
+"""
+__author__ = "David Williams"
+__maintainer__ = "David Williams"
+__email__ = "99williamsdav@gmail.com"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import config
+from config import db
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class FrameScoreTest(unittest.TestCase):
+
+    # Overview: Ingests the fixture match into a new database
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+
+        # every model shares config.db, so point it at the new database and drop any connection another test made
+        db.keywords['database'] = os.path.join(cls.dir, 'CueReview.sqlite')
+        db._ctx.clear()
+        db.writer_connection = None
+        db.printing = False
+        config.log_file = os.path.join(cls.dir, 'cuereview.log')
+
+        from app.models import schema
+        from app.models import tmatch
+
+        error, applied = schema.migrate()
+        assert error == '', error
+
+        filename = 'match_2013-01-01.csv'
+        csv = open(os.path.join(fixtures, filename)).read()
+        error, cls.match_id = tmatch.parseCsvMatch(csv, tmatch.getDateFromFilename(filename))
+        assert error == '', error
+
+        cls.frame_ids = [frame['frame_id'] for frame in db.select('tframe', where='match_id=$match_id',
+                                                                   vars={'match_id':cls.match_id}, order='frame_num')]
+
+    @classmethod
+    def tearDownClass(cls):
+        from app.utils import log
+        log.flush()
+
+        shutil.rmtree(cls.dir)
+
+    # Overview: Writes each frame's breaks again one at a time, as the old per-shot ingest did, and checks what
+    #           FrameScore stored against what breakpot.closeBreak worked out with getCurrentFrameScore
+    def test_break_scores(self):
+        from app.models import tframe
+
+        breaks = 0
+
+        t = db.transaction()
+        try:
+            for frame_id in self.frame_ids:
+                rows = list(db.query("SELECT * FROM tbreak WHERE frame_id=$frame_id ORDER BY break_id", vars={'frame_id':frame_id}))
+                db.query("DELETE FROM tbreak WHERE frame_id=$frame_id", vars={'frame_id':frame_id})
+
+                for vbreak in rows:
+                    # a break is already in tbreak, without a score, when closeBreak is called
+                    db.insert('tbreak', break_id=vbreak['break_id'], frame_id=frame_id, break_num=vbreak['break_num'],
+                                        player_id=vbreak['player_id'])
+
+                    frame_score = tframe.getCurrentFrameScore(frame_id, vbreak['player_id'])[0]
+                    opp_frame_score = tframe.getCurrentFrameScore(frame_id, vbreak['player_id'], opponent=True)[0]
+
+                    foul_num = None
+                    if vbreak['foul_num'] is None:
+                        frame_score += vbreak['score'] or 0
+                    else:
+                        foul_num = list(db.query("""
+                                    SELECT IFNULL(MAX(foul_num)+1, 1) as foul_num
+                                    FROM tbreak
+                                    WHERE frame_id=$frame_id AND
+                                        break_num=$break_num
+                            """, vars={'frame_id':frame_id, 'break_num':vbreak['break_num']}))[0]['foul_num']
+
+                    self.assertEqual((vbreak['foul_num'], vbreak['frame_score'], vbreak['opp_frame_score']),
+                                     (foul_num, frame_score, opp_frame_score), 'break %d' % vbreak['break_id'])
+
+                    db.update('tbreak', where='break_id=$break_id', vars={'break_id':vbreak['break_id']},
+                                        score=vbreak['score'], foul_num=vbreak['foul_num'])
+                    breaks += 1
+        finally:
+            t.rollback()
+
+        self.assertTrue(breaks > 0)
+
+    # Overview: Checks each player's frame score and foul points (tframescore) against getCurrentFrameScore
+    def test_frame_scores(self):
+        from app.models import tframe
+
+        for frame_id in self.frame_ids:
+            for row in db.select('tframescore', where='frame_id=$frame_id', vars={'frame_id':frame_id}):
+                self.assertEqual((row['score'], row['foul_points']), tframe.getCurrentFrameScore(frame_id, row['player_id']),
+                                 'frame %d player %d' % (frame_id, row['player_id']))
+
+    # Overview: Replays the stored breaks through FrameScore (as manage.py check-frame-scores does)
+    def test_check_frame_scores(self):
+        from app.models import framescore
+
+        report = framescore.checkFrameScores(self.frame_ids)
+
+        self.assertEqual(report['mismatches'], [])
+        self.assertEqual(report['frames'], len(self.frame_ids))
+
+
+if __name__ == '__main__':
+    unittest.main()